@@ -262,6 +262,17 @@ CELERY_TASK_TIME_LIMIT = 5 * 60
 CELERY_TASK_SOFT_TIME_LIMIT = 60
 # http://docs.celeryproject.org/en/latest/userguide/configuration.html#beat-scheduler
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
+# DatabaseScheduler syncs these entries into its PeriodicTask table on start
+CELERY_BEAT_SCHEDULE = {
+    "update-hot-questions": {
+        "task": "zihu_clone.qa.tasks.update_hot_questions",
+        "schedule": 60 * 5,
+    },
+    "prune-notifications": {
+        "task": "zihu_clone.notifications.tasks.prune_notifications",
+        "schedule": 60 * 60,
+    },
+}
 # django-allauth
 # ------------------------------------------------------------------------------
 ACCOUNT_ALLOW_REGISTRATION = env.bool("DJANGO_ACCOUNT_ALLOW_REGISTRATION", True)
@@ -310,3 +321,19 @@ HAYSTACK_CONNECTIONS = {
 HAYSTACK_SEARCH_RESULTS_PER_PAGE = 20  # 分页
 # 实时信号量处理器，模型类中数据增加、更新、删除时自动更新索引
 HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.RealtimeSignalProcessor'
+
+# 首页动态的时间线存储
+NEWS_TIMELINE_STORE = 'zihu_clone.news.timeline.CacheTimelineStore'
+NEWS_TIMELINE_MAX_LENGTH = 1000
+
+# 投票写缓冲，None 时同步写库；'zihu_clone.qa.vote_buffer.CacheVoteBuffer' 将投票暂存在 redis 中（需要 django-redis 缓存），
+# 由 flush_vote_buffer 任务批量写回（测试可用 InMemoryVoteBuffer）
+QA_VOTE_BUFFER = None
+
+# 通知保留策略：已读通知的最长保留天数、每个用户最多保留的通知数、每次删除的行数
+NOTIFICATION_READ_MAX_AGE_DAYS = env.int("NOTIFICATION_READ_MAX_AGE_DAYS", 90)
+NOTIFICATION_MAX_PER_USER = env.int("NOTIFICATION_MAX_PER_USER", 500)
+NOTIFICATION_PRUNE_CHUNK_SIZE = 1000
+
+# 在线状态存储，由 WebSocket 连接、心跳和断开维护
+USER_PRESENCE_STORE = 'zihu_clone.users.presence.CachePresenceStore'
@@ -51,3 +51,5 @@ EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
 
 # Your stuff...
 # ------------------------------------------------------------------------------
+NEWS_TIMELINE_STORE = 'zihu_clone.news.timeline.InMemoryTimelineStore'
+USER_PRESENCE_STORE = 'zihu_clone.users.presence.InMemoryPresenceStore'
@@ -5,3 +5,6 @@ from django.apps import AppConfig
 class ArticlesConfig(AppConfig):
     name = 'zihu_clone.articles'
     verbose_name = 'Articles'
+
+    def ready(self):
+        import zihu_clone.articles.signals  # noqa F401
@@ -0,0 +1,29 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from zihu_clone.markdown_cache import MarkdownCacheModel
+
+
+class Command(BaseCommand):
+    help = 'pre-render markdown content of articles, questions and answers saved before content_html existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', dest='all',
+                            help='re-check every row instead of only the never rendered ones')
+        parser.add_argument('--batch-size', type=int, default=500, dest='batch_size')
+
+    def handle(self, *args, **options):
+        for model in apps.get_models():
+            if not issubclass(model, MarkdownCacheModel):
+                continue
+            qs = model._default_manager.order_by()
+            if not options['all']:
+                qs = qs.filter(content_hash='')
+            rendered = 0
+            for obj in qs.only('pk', 'content', 'content_hash').iterator(chunk_size=options['batch_size']):
+                if obj.render_markdown():
+                    # queryset update so updated_at (and the search index) is left alone
+                    model._default_manager.filter(pk=obj.pk).update(
+                        content_html=obj.content_html, content_hash=obj.content_hash)
+                    rendered += 1
+            self.stdout.write(f'{model._meta.label}: rendered {rendered} rows')
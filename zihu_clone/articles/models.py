@@ -7,9 +7,11 @@ from django.db.models import Count
 
 from slugify import slugify
 from markdownx.models import MarkdownxField
-from markdownx.utils import markdownify
 from taggit.managers import TaggableManager
 
+from zihu_clone.markdown_cache import MarkdownCacheModel
+from zihu_clone.tags import POPULAR_TAGS_LIMIT, get_counted_tags
+
 class ArticleQuerySet(models.query.QuerySet):
     "self defined query set for convinience of reuse"
 
@@ -19,20 +21,8 @@ class ArticleQuerySet(models.query.QuerySet):
     def get_drafts(self):
         return self.filter(status="D").select_related('user')
 
-    def get_counted_tags(self):
-        tag_dict = {}
-        for obj in self.all():
-            for tag in obj.tags.names():
-                if tag not in tag_dict:
-                    tag_dict[tag] = 1
-
-                else:
-                    tag_dict[tag] += 1
-        return tag_dict.items()
-
 
-
-class Article(models.Model):
+class Article(MarkdownCacheModel):
     STATUS = (("D", "Draft"), ("P", "Published"))
 
     title = models.CharField(max_length=255, null=False, unique=True, verbose_name='titles')
@@ -55,11 +45,12 @@ class Article(models.Model):
     def __str__(self):
         return self.title
 
+    @classmethod
+    def get_popular_tags(cls, limit=POPULAR_TAGS_LIMIT):
+        "site wide top tags of published articles as (name, count) pairs, aggregated in SQL and cached"
+        return get_counted_tags(cls.objects.filter(status="P"), limit)
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
         super(Article, self).save(*args, **kwargs)
-
-    def get_markdown(self):
-        "use markdown extension to markdownify the content"
-        return markdownify(self.content)
@@ -0,0 +1,20 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from taggit.models import TaggedItem
+
+from zihu_clone.articles.models import Article
+from zihu_clone.tags import invalidate_counted_tags
+
+
+@receiver(m2m_changed, sender=TaggedItem)
+def article_tags_changed(sender, instance, action, **kwargs):
+    if isinstance(instance, Article) and action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_counted_tags(Article)
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_delete, sender=Article)
+def article_changed(sender, **kwargs):
+    """status changes move an article in or out of the published tag counts"""
+    invalidate_counted_tags(Article)
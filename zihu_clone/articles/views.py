@@ -10,19 +10,21 @@ from django_comments.signals import comment_was_posted
 from zihu_clone.articles.models import Article
 from zihu_clone.articles.forms import ArticleForm
 from zihu_clone.helpers import AuthorRequiredMixin
+from zihu_clone.pagination import CursorPaginationMixin
 from zihu_clone.notifications.views import notification_handler
 
 
-class ArticlesListView(LoginRequiredMixin, ListView):
+class ArticlesListView(LoginRequiredMixin, CursorPaginationMixin, ListView):
     "published articles"
     model = Article
     paginate_by = 20
+    cursor_ordering = ('created_at', 'pk')
     context_object_name = "articles"
     template_name = "articles/article_list.html"
 
     def get_context_data(self, *args, **kwargs):
         context = super(ArticlesListView, self).get_context_data(*args, **kwargs)
-        context['popular_tags'] = Article.objects.get_counted_tags()
+        context['popular_tags'] = Article.get_popular_tags()
         return context
 
     def get_queryset(self, **kwargs):
@@ -0,0 +1,13 @@
+import pytest
+
+from zihu_clone.users.tests.factories import UserFactory
+
+
+@pytest.fixture(autouse=True)
+def media_storage(settings, tmpdir):
+    settings.MEDIA_ROOT = tmpdir.strpath
+
+
+@pytest.fixture
+def user():
+    return UserFactory()
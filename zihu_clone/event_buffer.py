@@ -0,0 +1,93 @@
+import contextlib
+import json
+import threading
+import time
+
+from django.core.cache import cache
+
+
+def get_redis():
+    """raw client of the redis behind the default cache, None for caches without one (locmem in tests)"""
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        return None
+
+
+class CacheEventBuffer(object):
+    """append-only event buffer shared by every process, drained in one go by a single scheduled flush
+
+    with redis behind the cache events go to a list, RPUSH appends and LRANGE + DEL in one MULTI
+    drains, so no event can slip between reading and clearing. other caches keep the list in a
+    plain cache entry guarded by a thread lock, which is only safe for process local caches.
+    events must be json serializable.
+    """
+
+    def __init__(self, name, timeout=60 * 10):
+        self.name = name
+        self.timeout = timeout
+        self.lock = threading.Lock()
+
+    def _key(self, suffix):
+        return f'buffer:{self.name}:{suffix}'
+
+    def push(self, event):
+        """buffer event, returns True when the caller should schedule a flush"""
+        redis = get_redis()
+        if redis is not None:
+            pipe = redis.pipeline()
+            pipe.rpush(self._key('events'), json.dumps(event))
+            pipe.expire(self._key('events'), self.timeout)
+            pipe.execute()
+        else:
+            with self.lock:
+                events = cache.get(self._key('events')) or []
+                events.append(event)
+                cache.set(self._key('events'), events, self.timeout)
+        return cache.add(self._key('scheduled'), True, self.timeout)
+
+    def drain(self):
+        """pop every buffered event, oldest first"""
+        cache.delete(self._key('scheduled'))  # events pushed from here on schedule another flush
+        redis = get_redis()
+        if redis is not None:
+            pipe = redis.pipeline()
+            pipe.lrange(self._key('events'), 0, -1)
+            pipe.delete(self._key('events'))
+            raw, _ = pipe.execute()
+            return [json.loads(item) for item in raw]
+        with self.lock:
+            events = cache.get(self._key('events')) or []
+            cache.delete(self._key('events'))
+        return events
+
+    def restore(self, events):
+        """put drained events back in front of the ones pushed since, returns True like push"""
+        if not events:
+            return False
+        redis = get_redis()
+        if redis is not None:
+            pipe = redis.pipeline()
+            pipe.lpush(self._key('events'), *[json.dumps(event) for event in reversed(events)])
+            pipe.expire(self._key('events'), self.timeout)
+            pipe.execute()
+        else:
+            with self.lock:
+                cache.set(self._key('events'), list(events) + (cache.get(self._key('events')) or []),
+                          self.timeout)
+        return cache.add(self._key('scheduled'), True, self.timeout)
+
+
+@contextlib.contextmanager
+def cache_lock(key, timeout=5, wait=2.0, interval=0.005):
+    """mutex over cache.add shared by every process, it expires by itself if the holder dies"""
+    deadline = time.monotonic() + wait
+    while not cache.add(key, True, timeout):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f'could not acquire {key}')
+        time.sleep(interval)
+    try:
+        yield
+    finally:
+        cache.delete(key)
@@ -0,0 +1,39 @@
+import hashlib
+
+from django.db import models
+
+from markdownx.utils import markdownify
+
+
+def content_digest(content):
+    return hashlib.sha1((content or '').encode('utf-8')).hexdigest()
+
+
+class MarkdownCacheModel(models.Model):
+    """store the markdownified content next to the source, keyed by a hash of the source"""
+    content_html = models.TextField(blank=True, default='', editable=False, verbose_name='rendered content')
+    content_hash = models.CharField(max_length=40, blank=True, default='', editable=False,
+                                    verbose_name='rendered content hash')
+
+    class Meta:
+        abstract = True
+
+    def render_markdown(self):
+        """re-render content_html when content changed since the last render, return whether it did"""
+        digest = content_digest(self.content)
+        if digest == self.content_hash:
+            return False
+        self.content_html = markdownify(self.content)
+        self.content_hash = digest
+        return True
+
+    def save(self, *args, **kwargs):
+        if self.render_markdown() and kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'content_html', 'content_hash'}
+        super(MarkdownCacheModel, self).save(*args, **kwargs)
+
+    def get_markdown(self):
+        "serve the stored html, only falling back to markdownify for rows not rendered yet"
+        if self.content_hash and self.content_hash == content_digest(self.content):
+            return self.content_html
+        return markdownify(self.content)
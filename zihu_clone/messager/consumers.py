@@ -1,10 +1,29 @@
 
 import json
+import time
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from zihu_clone.messager.models import Message
+from zihu_clone.users.presence import get_presence_store
+
+SENT_TIMEOUT = 60 * 10  # 客户端重发的去重窗口
+SENT_PENDING = 'pending'  # client_id 已被占用，消息还在写入
+SENT_PENDING_TIMEOUT = 30  # 写入中途进程退出时，占用最多保留的秒数
 
 
 class MessagesConsumer(AsyncWebsocketConsumer):
-    """handle websocket request in the private messaging module"""
+    """handle websocket request in the private messaging module
+
+    the browser sends {"type": "send", "to": username, "message": text, "client_id": id}, is answered
+    with an ack carrying the stored id, and the recipient's sockets get the message as compact json.
+    a frame resent with the same client_id is acked again but stored and delivered only once.
+    {"type": "heartbeat"} keeps the user online in the presence store.
+    """
 
     async def connect(self):
         if self.scope['user'].is_anonymous:
@@ -13,11 +32,84 @@ class MessagesConsumer(AsyncWebsocketConsumer):
         else:
             await self.channel_layer.group_add(self.scope['user'].username, self.channel_name)
             await self.accept()
+            await sync_to_async(get_presence_store().touch)(self.scope['user'].pk, self.channel_name)
 
     async def receive(self, text_data=None, bytes_data=None):
         """receive private messages"""
-        await self.send(text_data=json.dumps(text_data))
+        try:
+            frame = json.loads(text_data)
+        except (TypeError, ValueError):
+            return
+        if not isinstance(frame, dict):
+            return
+        if frame.get('type') == 'heartbeat':
+            await sync_to_async(get_presence_store().touch)(self.scope['user'].pk, self.channel_name)
+            return
+        if frame.get('type') != 'send':
+            return
+        client_id = str(frame.get('client_id') or '')[:64]
+        text = str(frame.get('message') or '')
+        recipient = str(frame.get('to') or '')
+        if not text.strip() or recipient == self.scope['user'].username:
+            await self.send_json({'type': 'error', 'client_id': client_id, 'error': 'invalid message'})
+            return
+
+        payload, duplicate = await self.save_message(recipient, text, client_id)
+        if payload is None and duplicate:  # the first attempt is still running or failed meanwhile
+            await self.send_json({'type': 'error', 'client_id': client_id, 'error': 'not saved yet', 'retry': True})
+            return
+        if payload is None:
+            await self.send_json({'type': 'error', 'client_id': client_id, 'error': 'unknown recipient'})
+            return
+        await self.send_json({'type': 'ack', 'client_id': client_id, 'id': payload['id'],
+                              'created_at': payload['created_at'], 'duplicate': duplicate})
+        if not duplicate:
+            await self.channel_layer.group_send(recipient, {'type': 'chat_message', 'payload': payload})
+
+    async def chat_message(self, event):
+        """a message for this user, sent from another socket or from the send_message view"""
+        await self.send_json(event['payload'])
+
+    async def send_json(self, content):
+        await self.send(text_data=json.dumps(content, separators=(',', ':')))
+
+    @database_sync_to_async
+    def save_message(self, recipient_username, text, client_id):
+        """store the message once per client_id, returns (payload, whether it was a resend)"""
+        sender = self.scope['user']
+        key = f'messager:sent:{sender.pk}:{client_id}'
+        # claim the client_id before inserting, a resend racing the first insert then waits for its payload
+        if client_id and not cache.add(key, SENT_PENDING, SENT_PENDING_TIMEOUT):
+            return self.wait_for_payload(key), True
+        try:
+            recipient = get_user_model().objects.filter(username=recipient_username, is_active=True).first()
+            if recipient is None:
+                cache.delete(key)
+                return None, False
+            payload = Message.objects.create_message(sender, recipient, text).to_payload(client_id)
+        except Exception:
+            cache.delete(key)  # nothing stored, a resend may try again
+            raise
+        if client_id:
+            cache.set(key, payload, SENT_TIMEOUT)
+        return payload, False
+
+    @staticmethod
+    def wait_for_payload(key, wait=5.0, interval=0.05):
+        """payload stored under a claimed client_id, None when the first attempt did not finish in time"""
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            payload = cache.get(key)
+            if payload is None:
+                return None  # the first attempt failed and released the claim
+            if payload != SENT_PENDING:
+                return payload
+            time.sleep(interval)
+        return None
 
     async def disconnect(self, code):
         """leave the chat group"""
-        await self.channel_layer.group_discard(self.scope['user'].username, self.channel_name)
\ No newline at end of file
+        if self.scope['user'].is_anonymous:
+            return
+        await sync_to_async(get_presence_store().leave)(self.scope['user'].pk, self.channel_name)
+        await self.channel_layer.group_discard(self.scope['user'].username, self.channel_name)
@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from zihu_clone.messager.models import Conversation, Message
+
+
+class Command(BaseCommand):
+    help = 'file private messages sent before conversations existed under the conversation of their user pair'
+
+    def handle(self, *args, **options):
+        orphans = Message.objects.filter(
+            conversation__isnull=True, sender__isnull=False, recipient__isnull=False).order_by()
+        pairs = {tuple(sorted(pair)) for pair in orphans.values_list('sender_id', 'recipient_id').distinct()}
+        users = get_user_model().objects.in_bulk({pk for pair in pairs for pk in pair})
+
+        filed = 0
+        for one, two in pairs:
+            conversation = Conversation.objects.get_or_create_between(users[one], users[two])
+            filed += orphans.filter(
+                Q(sender_id=one, recipient_id=two) | Q(sender_id=two, recipient_id=one)
+            ).update(conversation=conversation)
+        self.stdout.write(f'filed {filed} messages under {len(pairs)} conversations')
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.text import Truncator
+
+from zihu_clone.messager.models import Conversation, Inbox
+
+
+class Command(BaseCommand):
+    help = 'recompute every inbox row from the messages, run after backfill_conversations'
+
+    def handle(self, *args, **options):
+        rebuilt = 0
+        for conversation in Conversation.objects.select_related('user_one', 'user_two').iterator():
+            messages = conversation.messages.all()
+            last = messages.order_by('-created_at').first()
+            if last is None:
+                continue
+            snippet = Truncator(last.message or '').chars(Inbox.SNIPPET_LENGTH)
+            with transaction.atomic():
+                for user, partner in ((conversation.user_one, conversation.user_two),
+                                      (conversation.user_two, conversation.user_one)):
+                    Inbox.objects.update_or_create(user=user, partner=partner, defaults={
+                        'conversation': conversation,
+                        'last_message': snippet,
+                        'last_message_at': last.created_at,
+                        'unread_count': messages.filter(recipient=user, unread=True).count(),
+                    })
+                    rebuilt += 1
+        self.stdout.write(f'rebuilt {rebuilt} inbox rows')
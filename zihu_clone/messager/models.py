@@ -3,27 +3,93 @@ import uuid
 
 from django.utils.encoding import python_2_unicode_compatible
 from django.conf import settings
-from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils.text import Truncator
+
+
+class ConversationQuerySet(models.query.QuerySet):
+
+    @staticmethod
+    def _ordered(user, other):
+        """the unordered user pair is stored lower pk first, so A->B and B->A share one row"""
+        return (user, other) if user.pk <= other.pk else (other, user)
+
+    def get_between(self, user, other):
+        user_one, user_two = self._ordered(user, other)
+        return self.filter(user_one=user_one, user_two=user_two).first()
+
+    def get_or_create_between(self, user, other):
+        user_one, user_two = self._ordered(user, other)
+        try:
+            with transaction.atomic():
+                return self.get_or_create(user_one=user_one, user_two=user_two)[0]
+        except IntegrityError:  # created by the other side in the meantime
+            return self.get(user_one=user_one, user_two=user_two)
+
+
+class Conversation(models.Model):
+    user_one = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='+',
+                                 on_delete=models.CASCADE, verbose_name='participant with the lower id')
+    user_two = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='+',
+                                 on_delete=models.CASCADE, verbose_name='participant with the higher id')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='creation time')
+
+    objects = ConversationQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'conversations'
+        verbose_name_plural = verbose_name
+        unique_together = ('user_one', 'user_two')
+
+    def __str__(self):
+        return f'{self.user_one} - {self.user_two}'
+
+    def other(self, user):
+        return self.user_two if user.pk == self.user_one_id else self.user_one
+
 
 class MessageQuerySet(models.query.QuerySet):
 
     def get_conversation(self, sender, recipient):
-        """private messges between users"""
-        qs_one = self.filter(sender=sender, recipient=recipient).select_related('sender', 'recipient')  # A->B
-        qs_two = self.filter(sender=recipient, recipient=sender).select_related('sender', 'recipient')  # B->A
-        return qs_one.union(qs_two).order_by('created_at')  # order by time
+        """private messges between users, oldest first, through the (conversation, created_at) index"""
+        conversation = Conversation.objects.get_between(sender, recipient)
+        if conversation is None:
+            return self.none()
+        return self.filter(conversation=conversation).select_related('sender', 'recipient').order_by('created_at')
+
+    def create_message(self, sender, recipient, message):
+        """the single write path of private messages, files the message under its conversation"""
+        conversation = Conversation.objects.get_or_create_between(sender, recipient)
+        with transaction.atomic():
+            msg = self.create(sender=sender, recipient=recipient, message=message, conversation=conversation)
+            Inbox.objects.record_message(msg)
+        return msg
+
+    def mark_conversation_as_read(self, conversation, reader, up_to=None):
+        """mark what reader received in the conversation read with one UPDATE
+
+        up_to, a message or a datetime, limits it to messages sent until then, the inbox unread count
+        follows. returns the number of messages marked.
+        """
+        if isinstance(up_to, Message):
+            up_to = up_to.created_at
+        qs = self.filter(conversation=conversation, recipient=reader, unread=True)
+        if up_to is not None:
+            qs = qs.filter(created_at__lte=up_to)
+        with transaction.atomic():
+            marked = qs.update(unread=False)
+            if marked:
+                remaining = 0 if up_to is None else self.filter(
+                    conversation=conversation, recipient=reader, unread=True).count()
+                Inbox.objects.filter(user=reader, conversation=conversation).update(unread_count=remaining)
+        return marked
 
     def get_most_recent_conversation(self, recipient):
-        try:
-            qs_sent = self.filter(sender=recipient).select_related('sender', 'recipient')
-            qs_received = self.filter(recipient=recipient).select_related('sender', 'recipient')
-            qs = qs_sent.union(qs_received).latest("created_at")
-            if qs.sender == recipient:
-                return qs.recipient
-            return qs.sender
-        except self.model.DoesNotExist:
-            return get_user_model().objects.get(username=recipient.username)
+        """partner of the latest conversation, read from the inbox, the user themselves without one"""
+        latest = Inbox.objects.get_inbox(recipient).first()
+        return latest.partner if latest is not None else recipient
+
 
 class Message(models.Model):
     uuid_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -31,6 +97,8 @@ class Message(models.Model):
                                blank=True, null=True, on_delete=models.SET_NULL, verbose_name='sender')
     recipient = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='received_messages',
                                   blank=True, null=True, on_delete=models.SET_NULL, verbose_name='receiver')
+    conversation = models.ForeignKey(Conversation, related_name='messages', blank=True, null=True,
+                                     on_delete=models.SET_NULL, verbose_name='conversation')
     message = models.TextField(blank=True, null=True, verbose_name='message content')
     unread = models.BooleanField(default=True, verbose_name='read or unread')
 
@@ -42,6 +110,7 @@ class Message(models.Model):
         verbose_name = 'private messages'
         verbose_name_plural = verbose_name
         ordering = ('-created_at',)
+        indexes = [models.Index(fields=['conversation', 'created_at'])]
 
     def __str__(self):
         return self.message
@@ -49,4 +118,68 @@ class Message(models.Model):
     def mark_as_read(self):
         if self.unread:
             self.unread = False
-            self.save()
+            self.save(update_fields=['unread'])
+
+    def to_payload(self, client_id=None):
+        """compact json for the websocket, the browser renders it itself"""
+        return {
+            'type': 'message',
+            'id': str(self.uuid_id),
+            'client_id': client_id,
+            'sender': self.sender.username,
+            'recipient': self.recipient.username,
+            'message': self.message,
+            'created_at': self.created_at.isoformat(),
+        }
+
+
+class InboxQuerySet(models.query.QuerySet):
+
+    def get_inbox(self, user):
+        """conversations of user, latest first, one read of the (user, last_message_at) index"""
+        return self.filter(user=user).select_related('partner').order_by('-last_message_at')
+
+    def _touch(self, user, partner, conversation, fields, unread):
+        if self.filter(user=user, partner=partner).update(
+                unread_count=F('unread_count') + unread, **fields):
+            return
+        try:
+            with transaction.atomic():
+                self.create(user=user, partner=partner, conversation=conversation, unread_count=unread, **fields)
+        except IntegrityError:  # created concurrently, the update now finds it
+            self.filter(user=user, partner=partner).update(unread_count=F('unread_count') + unread, **fields)
+
+    def record_message(self, msg):
+        """move the conversation to the top of both inboxes, counting the message as unread for the recipient"""
+        fields = {
+            'last_message': Truncator(msg.message or '').chars(Inbox.SNIPPET_LENGTH),
+            'last_message_at': msg.created_at,
+        }
+        self._touch(msg.sender, msg.recipient, msg.conversation, fields, 0)
+        self._touch(msg.recipient, msg.sender, msg.conversation, fields, 1)
+
+
+class Inbox(models.Model):
+    """one row per user and conversation partner, denormalized from Message for the messages sidebar"""
+    SNIPPET_LENGTH = 100
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='inbox',
+                             on_delete=models.CASCADE, verbose_name='owner')
+    partner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='+',
+                                on_delete=models.CASCADE, verbose_name='conversation partner')
+    conversation = models.ForeignKey(Conversation, related_name='+',
+                                     on_delete=models.CASCADE, verbose_name='conversation')
+    last_message = models.CharField(max_length=255, blank=True, verbose_name='last message snippet')
+    last_message_at = models.DateTimeField(verbose_name='last message time')
+    unread_count = models.IntegerField(default=0, verbose_name='unread messages')
+
+    objects = InboxQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'inbox'
+        verbose_name_plural = verbose_name
+        unique_together = ('user', 'partner')
+        indexes = [models.Index(fields=['user', '-last_message_at'])]
+
+    def __str__(self):
+        return f'{self.user} <- {self.partner}'
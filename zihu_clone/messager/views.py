@@ -1,6 +1,6 @@
 from asgiref.sync import async_to_sync
 from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -10,62 +10,104 @@ from django.template.loader import render_to_string
 
 from channels.layers import get_channel_layer
 
-from zihu_clone.messager.models import Message
+from zihu_clone.messager.models import Inbox, Message
 from zihu_clone.helpers import ajax_required
+from zihu_clone.pagination import CursorPaginationMixin
+from zihu_clone.users.presence import get_online_users, get_presence_store
 
+MESSAGE_PAGE_SIZE = 30
+INBOX_SIZE = 20
 
-class MessagesListView(LoginRequiredMixin, ListView):
+
+class MessagesListView(LoginRequiredMixin, CursorPaginationMixin, ListView):
+    """the latest MESSAGE_PAGE_SIZE messages of a conversation, the page cursor scrolls back to older ones"""
     model = Message
+    paginate_by = MESSAGE_PAGE_SIZE
     template_name = "messager/message_list.html"
 
+    def paginate_queryset(self, queryset, page_size):
+        # pages run newest first so the first one is the latest messages, each is shown oldest first
+        paginator, page, object_list, is_paginated = super(MessagesListView, self).paginate_queryset(
+            queryset, page_size)
+        page.object_list.reverse()
+        return paginator, page, object_list, is_paginated
+
+    def render_to_response(self, context, **response_kwargs):
+        if self.request.is_ajax():  # scroll-back request for the page before the given cursor
+            page = context['page_obj']
+            return JsonResponse({
+                'messages': ''.join(render_to_string('messager/single_message.html', {'message': message})
+                                    for message in page),
+                'next': page.next_cursor,
+            })
+        return super(MessagesListView, self).render_to_response(context, **response_kwargs)
+
+    def get_inbox(self):
+        if not hasattr(self, '_inbox'):
+            self._inbox = list(Inbox.objects.get_inbox(self.request.user)[:INBOX_SIZE])
+        return self._inbox
+
+    def get_active_user(self):
+        """partner of the latest conversation, the user themselves before their first message"""
+        inbox = self.get_inbox()
+        return inbox[0].partner if inbox else self.request.user
+
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super(MessagesListView, self).get_context_data()
-        context['users_list'] = get_user_model().objects.filter(is_active=True).exclude(
-            username=self.request.user
-        ).order_by('-last_login')[:10]
-        last_conversation = Message.objects.get_most_recent_conversation(self.request.user)
-        context['active'] = last_conversation.username
+        inbox = self.get_inbox()
+        context['inbox'] = inbox
+        online = get_presence_store().online_user_ids()
+        context['online'] = set(online)
+        if inbox:
+            context['users_list'] = [entry.partner for entry in inbox]
+        else:  # nobody to talk to yet, suggest whoever is online
+            context['users_list'] = get_online_users(exclude=self.request.user.pk, limit=10)
+        context['active'] = self.get_active_user().username
+        self.mark_as_read(context['page_obj'])
         return context
 
+    def mark_as_read(self, page):
+        """opening a conversation reads everything up to the newest message shown, in one UPDATE"""
+        entry = self._active_entry
+        if not page.object_list or (entry is not None and not entry.unread_count):
+            return
+        newest = page.object_list[-1]
+        Message.objects.mark_conversation_as_read(newest.conversation_id, self.request.user, up_to=newest)
+        if entry is not None:
+            entry.unread_count = 0
+
     def get_queryset(self):
-        active_user = Message.objects.get_most_recent_conversation(self.request.user)
-        return Message.objects.get_conversation(self.request.user, active_user)
+        active_user = self.get_active_user()
+        self._active_entry = next(
+            (entry for entry in self.get_inbox() if entry.partner_id == active_user.pk), None)
+        if self._active_entry is None:
+            return Message.objects.get_conversation(self.request.user, active_user)
+        return Message.objects.filter(
+            conversation_id=self._active_entry.conversation_id).select_related('sender', 'recipient')
 
 
 class ConversationListView(MessagesListView):
 
-    def get_context_data(self, *, object_list=None, **kwargs):
-        context = super(ConversationListView, self).get_context_data()
-        context['active'] = self.kwargs["username"]
-        return context
-
-    def get_queryset(self):
-        active_user = get_object_or_404(get_user_model(),
-                                        username=self.kwargs["username"])
-        return Message.objects.get_conversation(self.request.user, active_user)
+    def get_active_user(self):
+        if not hasattr(self, '_active_user'):
+            self._active_user = get_object_or_404(get_user_model(), username=self.kwargs["username"])
+        return self._active_user
 
 
 @login_required
 @ajax_required
 @require_http_methods(["POST"])
 def send_message(request):
+    """http fallback of the websocket send frame, for browsers without a socket"""
     sender = request.user
     recipient_username = request.POST['to']
     recipient = get_user_model().objects.get(username=recipient_username)
     message = request.POST['message']
     if len(message.strip()) != 0 and sender != recipient:
-        msg = Message.objects.create(
-            sender=sender,
-            recipient=recipient,
-            message=message
-        )
+        msg = Message.objects.create_message(sender, recipient, message)
 
         channel_layer = get_channel_layer()
-        payload = {
-            'type': 'receive',
-            'message': render_to_string('messager/single_message.html', {"message": msg}),
-            'sender': sender.username
-        }
+        payload = {'type': 'chat_message', 'payload': msg.to_payload()}
         async_to_sync(channel_layer.group_send)(recipient.username, payload)
         return render(request, 'messager/single_message.html', {'message': msg})
 
@@ -8,3 +8,6 @@ from django.apps import AppConfig
 class NewsConfig(AppConfig):
     name = 'zihu_clone.news'
     verbose_name = 'News'
+
+    def ready(self):
+        import zihu_clone.news.signals  # noqa F401
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from zihu_clone.news import timeline
+from zihu_clone.news.models import News
+
+
+class Command(BaseCommand):
+    help = 'rebuild the news feed timeline from the News table'
+
+    def handle(self, *args, **options):
+        timeline.rebuild(News.objects.filter(reply=False))
+        entries = timeline.get_timeline_store().get(timeline.GLOBAL_TIMELINE)
+        self.stdout.write(f'timeline rebuilt with {len(entries or [])} news')
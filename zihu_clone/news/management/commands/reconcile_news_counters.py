@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from zihu_clone.news.models import News
+
+
+class Command(BaseCommand):
+    help = 'recount like_count and reply_count of every news from the like and reply tables'
+
+    def handle(self, *args, **options):
+        likes = News.liked.through.objects.filter(news_id=OuterRef('pk')).order_by().values(
+            'news_id').annotate(n=Count('pk')).values('n')
+        replies = News.objects.filter(parent_id=OuterRef('pk')).order_by().values(
+            'parent_id').annotate(n=Count('pk')).values('n')
+        drifted = News.objects.annotate(
+            actual_likes=Coalesce(Subquery(likes, output_field=IntegerField()), 0),
+            actual_replies=Coalesce(Subquery(replies, output_field=IntegerField()), 0),
+        ).filter(
+            ~Q(like_count=F('actual_likes')) | ~Q(reply_count=F('actual_replies'))
+        ).values_list('pk', 'actual_likes', 'actual_replies')
+
+        fixed = 0
+        for pk, actual_likes, actual_replies in drifted.iterator():
+            News.objects.filter(pk=pk).update(like_count=actual_likes, reply_count=actual_replies)
+            fixed += 1
+        self.stdout.write(f'reconciled counters of {fixed} news')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from zihu_clone.news import timeline
+
+
+class Command(BaseCommand):
+    help = 'cut the news feed timeline down to its maximum length'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--length', type=int, default=None, dest='length',
+                            help='entries to keep, defaults to NEWS_TIMELINE_MAX_LENGTH')
+
+    def handle(self, *args, **options):
+        store = timeline.get_timeline_store()
+        store.trim(timeline.GLOBAL_TIMELINE, options['length'])
+        entries = store.get(timeline.GLOBAL_TIMELINE)
+        self.stdout.write(f'timeline holds {len(entries or [])} news')
@@ -3,10 +3,13 @@ import uuid
 
 from django.utils.encoding import python_2_unicode_compatible
 from django.conf import settings
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+from zihu_clone.news.tasks import queue_additional_news
+from zihu_clone.pagination import CursorPaginator
+
+THREAD_PAGE_SIZE = 20
 
 class News(models.Model):
     uuid_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -17,6 +20,8 @@ class News(models.Model):
     content = models.TextField(verbose_name='content updates')
     liked = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='liked news', verbose_name='liked users')
     reply = models.BooleanField(default=False, verbose_name='reply or not')
+    like_count = models.IntegerField(default=0, verbose_name='like count')
+    reply_count = models.IntegerField(default=0, verbose_name='reply count')
     created_at = models.DateTimeField(db_index=True, auto_now_add=True, verbose_name='creation time')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='update time')
 
@@ -24,27 +29,38 @@ class News(models.Model):
         verbose_name = 'Home page'
         verbose_name_plural = verbose_name
         ordering = ("-created_at",)
+        indexes = [models.Index(fields=['parent', 'created_at'])]
 
     def __str__(self):
         return self.content
 
     def save(self, *args, **kwargs):
+        created = self._state.adding
         super(News, self).save(*args, **kwargs)
 
-        if not self.reply:
-            channel_layer = get_channel_layer()
-            payload = {
-                "type": "receive",
-                "key": "additional_news",
-                "actor_name": self.user.username
-            }
-            async_to_sync(channel_layer.group_send)('notifications', payload)
+        if created and not self.reply and self.user:
+            # 广播交给celery按时间窗口合并发送，请求线程不再访问频道层
+            actor_name = self.user.username
+            transaction.on_commit(lambda: queue_additional_news(actor_name))
 
     def switch_like(self, user):
-        if user in self.liked.all():
-            self.liked.remove(user)
-        else:
-            self.liked.add(user)
+        """like or unlike on the through table directly, returns whether user likes the news afterwards"""
+        through = News.liked.through
+        likes = through.objects.filter(news_id=self.pk, user_id=user.pk)
+        with transaction.atomic():
+            if likes.delete()[0]:
+                liked, delta = False, -1
+            else:
+                try:
+                    with transaction.atomic():
+                        through.objects.create(news_id=self.pk, user_id=user.pk)
+                    liked, delta = True, 1
+                except IntegrityError:  # a concurrent request liked it first
+                    liked, delta = True, 0
+            if delta:
+                News.objects.filter(pk=self.pk).update(like_count=F('like_count') + delta)
+        self.refresh_from_db(fields=['like_count'])
+        return liked
 
     def get_parent(self):
         if self.parent:
@@ -60,18 +76,26 @@ class News(models.Model):
             reply=True,
             parent=parent
         )
+        News.objects.filter(pk=parent.pk).update(reply_count=F('reply_count') + 1)
+        parent.refresh_from_db(fields=['reply_count'])
+
     def get_thread(self):
 
         parent = self.get_parent()
         return parent.thread.all()
 
+    def get_thread_page(self, cursor=None, per_page=THREAD_PAGE_SIZE):
+        """one page of replies newest first, its next_cursor points to older replies"""
+        replies = self.get_parent().thread.select_related('user')
+        return CursorPaginator(replies, per_page, ('-created_at', '-pk')).page(cursor)
+
     def comment_count(self):
 
-        return self.get_thread().count()
+        return self.get_parent().reply_count
 
     def count_likers(self):
 
-        return self.liked.count()
+        return self.like_count
 
     def get_likers(self):
 
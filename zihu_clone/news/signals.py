@@ -0,0 +1,26 @@
+from django.db.models import F
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from zihu_clone.news import timeline
+from zihu_clone.news.models import News
+
+
+@receiver(post_delete, sender=News)
+def reply_deleted(sender, instance, **kwargs):
+    """keep the parent's reply_count in step when a reply goes away"""
+    if instance.parent_id:
+        News.objects.filter(pk=instance.parent_id).update(reply_count=F('reply_count') - 1)
+
+
+@receiver(post_save, sender=News)
+def news_posted(sender, instance, created, **kwargs):
+    if created and not instance.reply:
+        transaction.on_commit(lambda: timeline.fan_out(instance))
+
+
+@receiver(post_delete, sender=News)
+def news_deleted(sender, instance, **kwargs):
+    if not instance.reply:
+        transaction.on_commit(lambda: timeline.retract(instance))
@@ -0,0 +1,33 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from config import celery_app
+from zihu_clone.event_buffer import CacheEventBuffer
+from zihu_clone.notifications.groups import topic_group
+
+ADDITIONAL_NEWS_WINDOW = 2  # 秒，窗口内的新动态合并成一条推送
+
+additional_news = CacheEventBuffer('news:additional')
+
+
+def queue_additional_news(actor_name):
+    """buffer a new-news event, the first one of a window schedules the broadcast"""
+    if additional_news.push(actor_name):
+        broadcast_additional_news.apply_async(countdown=ADDITIONAL_NEWS_WINDOW)
+
+
+@celery_app.task()
+def broadcast_additional_news():
+    """send every news posted during the window as one "additional_news" frame"""
+    actors = additional_news.drain()
+    if not actors:
+        return 0
+    payload = {
+        "type": "notify",
+        "key": "additional_news",
+        "actor_name": actors[-1],
+        "actors": list(dict.fromkeys(actors)),
+        "count": len(actors),
+    }
+    async_to_sync(get_channel_layer().group_send)(topic_group('news'), payload)
+    return len(actors)
@@ -0,0 +1,191 @@
+import datetime
+import functools
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from zihu_clone.event_buffer import cache_lock
+from zihu_clone.pagination import CursorPage
+
+GLOBAL_TIMELINE = 'global'
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_score(created_at):
+    """exact integer microseconds, floats lose the last digits of a timestamp"""
+    return (created_at - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def make_entry(news):
+    return to_score(news.created_at), str(news.pk)
+
+
+class BaseTimelineStore(object):
+    """capped lists of (score, news id) entries, newest first
+
+    subclasses provide get/set/delete, get returns None for a timeline that was never built, and
+    locked(key) when the timeline is shared beyond the process.
+    """
+
+    def __init__(self, max_length=None):
+        self.max_length = max_length or getattr(settings, 'NEWS_TIMELINE_MAX_LENGTH', 1000)
+        self.lock = threading.Lock()
+
+    def locked(self, key):
+        """guards the read-modify-write of push, remove and trim"""
+        return self.lock
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, entries):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def replace(self, key, entries):
+        self.set(key, sorted(entries, reverse=True)[:self.max_length])
+
+    def push(self, key, entry):
+        """add an entry, a timeline that was never built stays unbuilt until rebuilt"""
+        with self.locked(key):
+            entries = self.get(key)
+            if entries is None:
+                return
+            entries = [e for e in entries if e[1] != entry[1]]
+            entries.append(tuple(entry))
+            self.replace(key, entries)
+
+    def remove(self, key, item_id):
+        with self.locked(key):
+            entries = self.get(key)
+            if entries is not None:
+                self.set(key, [e for e in entries if e[1] != item_id])
+
+    def trim(self, key, max_length=None):
+        with self.locked(key):
+            entries = self.get(key)
+            if entries is not None:
+                self.set(key, entries[:max_length or self.max_length])
+
+
+class CacheTimelineStore(BaseTimelineStore):
+    """timelines kept in the django cache (redis in local/production), shared by every process
+
+    updates are read-modify-write under a cache lock, so workers posting at the same time never
+    overwrite each other.
+    """
+    prefix = 'news:timeline:'
+
+    def locked(self, key):
+        return cache_lock(f'{self.prefix}{key}:lock')
+
+    def get(self, key):
+        entries = cache.get(self.prefix + key)
+        return None if entries is None else [tuple(e) for e in entries]
+
+    def set(self, key, entries):
+        cache.set(self.prefix + key, list(entries), None)
+
+    def delete(self, key):
+        cache.delete(self.prefix + key)
+
+
+class InMemoryTimelineStore(BaseTimelineStore):
+    """process local stand-in for tests"""
+
+    def __init__(self, max_length=None):
+        super(InMemoryTimelineStore, self).__init__(max_length)
+        self.timelines = {}
+
+    def get(self, key):
+        entries = self.timelines.get(key)
+        return None if entries is None else list(entries)
+
+    def set(self, key, entries):
+        self.timelines[key] = list(entries)
+
+    def delete(self, key):
+        self.timelines.pop(key, None)
+
+
+@functools.lru_cache(maxsize=None)
+def get_timeline_store():
+    store_class = getattr(settings, 'NEWS_TIMELINE_STORE', 'zihu_clone.news.timeline.CacheTimelineStore')
+    return import_string(store_class)()
+
+
+def fan_out(news):
+    """push a freshly posted news into the timelines that show it"""
+    if not news.reply:
+        _update(GLOBAL_TIMELINE, lambda store: store.push(GLOBAL_TIMELINE, make_entry(news)))
+
+
+def retract(news):
+    _update(GLOBAL_TIMELINE, lambda store: store.remove(GLOBAL_TIMELINE, str(news.pk)))
+
+
+def _update(key, change):
+    """apply change to the timeline, one that cannot be locked in time is dropped and rebuilt on next read"""
+    store = get_timeline_store()
+    try:
+        change(store)
+    except TimeoutError:
+        store.delete(key)
+
+
+def rebuild(queryset, key=GLOBAL_TIMELINE, missing_only=False):
+    """fill the timeline from queryset, holding the lock push and remove take
+
+    a news committed after the select fans out only once the rebuilt list is written, so it is pushed
+    into that list instead of being dropped against the unbuilt one. with missing_only a timeline
+    someone else built meanwhile is left alone. raises TimeoutError like push when the lock is busy.
+    """
+    store = get_timeline_store()
+    with store.locked(key):
+        if missing_only and store.get(key) is not None:
+            return
+        rows = queryset.prefetch_related(None).order_by('-created_at', '-pk').values_list(
+            'created_at', 'pk')[:store.max_length]
+        store.replace(key, [(to_score(created_at), str(pk)) for created_at, pk in rows])
+
+
+def timeline_page(paginator, cursor=None, key=GLOBAL_TIMELINE):
+    """serve a ('-created_at', '-pk') CursorPaginator page from the timeline, hydrating the news by pk
+
+    a timeline that was never built (or fell out of the cache) is rebuilt from paginator.queryset first.
+    returns None when the page lies past the capped tail or the timeline is being rebuilt elsewhere,
+    the caller then falls back to paginator.page(cursor), which understands the same cursors.
+    """
+    store = get_timeline_store()
+    entries = store.get(key)
+    if entries is None:
+        try:
+            rebuild(paginator.queryset, key, missing_only=True)
+        except TimeoutError:
+            return None
+        entries = store.get(key) or []
+
+    per_page = paginator.per_page
+    values, backwards = paginator.decode_cursor(cursor) if cursor else (None, False)
+    bound = (to_score(values[0]), str(values[1])) if values else None
+    if backwards:
+        newer = [e for e in entries if e > bound]
+        window, has_next, has_previous = newer[-per_page:], True, len(newer) > per_page
+    else:
+        older = [e for e in entries if bound is None or e < bound]
+        if len(older) <= per_page and len(entries) >= store.max_length:
+            return None
+        window, has_next, has_previous = older[:per_page], len(older) > per_page, bound is not None
+
+    news = paginator.queryset.in_bulk([item_id for _, item_id in window])
+    news = {str(pk): obj for pk, obj in news.items()}
+    rows = [news[item_id] for _, item_id in window if item_id in news]
+
+    next_cursor = paginator.encode_cursor(rows[-1]) if rows and has_next else None
+    previous_cursor = paginator.encode_cursor(rows[0], backwards=True) if rows and has_previous else None
+    return CursorPage(rows, paginator, next_cursor, previous_cursor)
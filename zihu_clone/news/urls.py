@@ -9,4 +9,5 @@ urlpatterns = [
     path('get-thread/', views.get_thread, name='get_thread'),
     path('post-comment/', views.post_comment, name='post_comments'),
     path('update-interactions/', views.update_interactions, name='update_interactions'),
+    path('update-interactions/batch/', views.update_interactions_batch, name='update_interactions_batch'),
 ]
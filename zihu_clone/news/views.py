@@ -1,16 +1,28 @@
+import uuid
+
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.template.loader import render_to_string
 from django.urls import reverse_lazy
 from django.views.decorators.http import require_http_methods
 from django.views.generic import ListView, DeleteView
 
 from zihu_clone.helpers import ajax_required, AuthorRequiredMixin
+from zihu_clone.news import timeline
 from zihu_clone.news.models import News
+from zihu_clone.pagination import CursorPaginationMixin, CursorPaginator, InvalidCursor
+
+INTERACTIONS_CACHE_TIMEOUT = 5  # 秒，批量轮询的计数只需近似实时
+INTERACTIONS_BATCH_LIMIT = 100
+
 
+def _interactions_key(news_id):
+    return f'news:interactions:{news_id}'
 
-class NewsListView(LoginRequiredMixin, ListView):
+
+class NewsListView(LoginRequiredMixin, CursorPaginationMixin, ListView):
     model = News
     paginate_by = 20
     template_name = 'news/news_list.html'
@@ -18,6 +30,17 @@ class NewsListView(LoginRequiredMixin, ListView):
     def get_queryset(self, **kwargs):
         return News.objects.filter(reply=False).select_related('user', 'parent').prefetch_related('liked')
 
+    def paginate_queryset(self, queryset, page_size):
+        """serve the page from the precomputed timeline, scanning the table only when it cannot"""
+        paginator = CursorPaginator(queryset, page_size, self.cursor_ordering)
+        try:
+            page = timeline.timeline_page(paginator, self.request.GET.get(self.page_kwarg))
+        except InvalidCursor:
+            raise Http404('invalid page cursor')
+        if page is None:
+            return super(NewsListView, self).paginate_queryset(queryset, page_size)
+        return paginator, page, page.object_list, page.has_other_pages()
+
 
 class NewsDeleteView(LoginRequiredMixin, AuthorRequiredMixin, DeleteView):
     model = News
@@ -44,6 +67,7 @@ def like(request):
     news_id = request.POST['news']
     news = News.objects.get(pk=news_id)
     news.switch_like(request.user)
+    cache.delete(_interactions_key(news.pk))
     return JsonResponse({"likes": news.count_likers()})
 
 
@@ -51,15 +75,22 @@ def like(request):
 @ajax_required
 @require_http_methods(["GET"])
 def get_thread(request):
+    """the news and a page of its replies, pass the returned next cursor back to load older replies"""
     news_id = request.GET['news']
+    cursor = request.GET.get('cursor')
     news = News.objects.select_related('user').get(pk=news_id)
-    news_html = render_to_string("news/news_single.html", {"news": news})
-    thread_html = render_to_string("news/news_thread.html", {"thread": news.get_thread()})
-    return JsonResponse({
+    try:
+        thread = news.get_thread_page(cursor)
+    except InvalidCursor:
+        return HttpResponseBadRequest("invalid cursor!")
+    data = {
         "uuid": news_id,
-        "news": news_html,
-        "thread": thread_html,
-    })
+        "thread": render_to_string("news/news_thread.html", {"thread": thread}),
+        "next": thread.next_cursor,
+    }
+    if not cursor:
+        data["news"] = render_to_string("news/news_single.html", {"news": news})
+    return JsonResponse(data)
 
 
 @login_required
@@ -71,6 +102,7 @@ def post_comment(request):
     parent = News.objects.get(pk=parent_id)
     if post:
         parent.reply_this(request.user, post)
+        cache.delete(_interactions_key(parent.get_parent().pk))
         return JsonResponse({'comments': parent.comment_count()})
     else:
         return HttpResponseBadRequest("content cannot be empty!")
@@ -84,3 +116,31 @@ def update_interactions(request):
     news = News.objects.get(pk=data_point)
     return JsonResponse({'likes': news.count_likers(), 'comments': news.comment_count()})
 
+
+@login_required
+@ajax_required
+@require_http_methods(["POST"])
+def update_interactions_batch(request):
+    """likes and comments of every news in ids[], read from the counters in one query and briefly cached"""
+    news_ids = []
+    for value in request.POST.getlist('ids[]') or request.POST.getlist('ids'):
+        try:
+            news_ids.append(str(uuid.UUID(value)))
+        except ValueError:
+            return HttpResponseBadRequest("invalid news id!")
+    news_ids = list(dict.fromkeys(news_ids))[:INTERACTIONS_BATCH_LIMIT]
+
+    cached = cache.get_many([_interactions_key(news_id) for news_id in news_ids])
+    interactions = {news_id: cached[_interactions_key(news_id)]
+                    for news_id in news_ids if _interactions_key(news_id) in cached}
+    missing = [news_id for news_id in news_ids if news_id not in interactions]
+    if missing:
+        fresh = {
+            str(pk): {'likes': likes, 'comments': comments}
+            for pk, likes, comments in News.objects.filter(pk__in=missing).values_list(
+                'pk', 'like_count', 'reply_count')
+        }
+        cache.set_many({_interactions_key(news_id): counts for news_id, counts in fresh.items()},
+                       INTERACTIONS_CACHE_TIMEOUT)
+        interactions.update(fresh)
+    return JsonResponse({'interactions': interactions})
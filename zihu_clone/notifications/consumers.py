@@ -1,7 +1,11 @@
 import json
 
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from zihu_clone.notifications.groups import TOPICS, topic_group, user_group
+from zihu_clone.users.presence import get_presence_store
+
 
 class NotificationsConsumer(AsyncWebsocketConsumer):
     """Handle websocket request in messaging app"""
@@ -10,11 +14,43 @@ class NotificationsConsumer(AsyncWebsocketConsumer):
         if self.scope['user'].is_anonymous:
             await self.close()
         else:
-            await self.channel_layer.group_add('notifications', self.channel_name)
+            self.topics = set()
+            await self.channel_layer.group_add(user_group(self.scope['user'].pk), self.channel_name)
             await self.accept()
+            await sync_to_async(get_presence_store().touch)(self.scope['user'].pk, self.channel_name)
 
     async def receive(self, text_data=None, bytes_data=None):
-        await self.send(text_data=json.dumps(text_data))
+        """{"type": "subscribe" | "unsubscribe", "topic": ...} frames manage the topic groups
+
+        {"type": "heartbeat"} keeps the user online in the presence store.
+        """
+        try:
+            frame = json.loads(text_data)
+        except (TypeError, ValueError):
+            return
+        if not isinstance(frame, dict):
+            return
+        if frame.get('type') == 'heartbeat':
+            await sync_to_async(get_presence_store().touch)(self.scope['user'].pk, self.channel_name)
+            return
+        if frame.get('topic') not in TOPICS:
+            return
+        topic = frame['topic']
+        if frame.get('type') == 'subscribe' and topic not in self.topics:
+            self.topics.add(topic)
+            await self.channel_layer.group_add(topic_group(topic), self.channel_name)
+        elif frame.get('type') == 'unsubscribe' and topic in self.topics:
+            self.topics.discard(topic)
+            await self.channel_layer.group_discard(topic_group(topic), self.channel_name)
+
+    async def notify(self, event):
+        """an event for this socket's user or one of its topics, forwarded as it is"""
+        await self.send(text_data=json.dumps(event))
 
     async def disconnect(self, code):
-        await self.channel_layer.group_discard('notifications', self.channel_name)
+        if self.scope['user'].is_anonymous:
+            return
+        await sync_to_async(get_presence_store().leave)(self.scope['user'].pk, self.channel_name)
+        await self.channel_layer.group_discard(user_group(self.scope['user'].pk), self.channel_name)
+        for topic in getattr(self, 'topics', ()):
+            await self.channel_layer.group_discard(topic_group(topic), self.channel_name)
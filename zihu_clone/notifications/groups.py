@@ -0,0 +1,16 @@
+"""channel layer group names of the notifications socket
+
+every socket joins the group of its user, so an event reaches only the sockets of its recipient.
+broadcasts that interest a page rather than a user go to topic groups, which a socket joins by
+sending {"type": "subscribe", "topic": ...}.
+"""
+
+TOPICS = ('news',)  # 新动态提示和点赞、评论数的实时更新
+
+
+def user_group(user_id):
+    return f'notifications-{user_id}'
+
+
+def topic_group(topic):
+    return f'topic-{topic}'
@@ -0,0 +1,47 @@
+import asyncio
+import random
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'compare delivering notifications through one global group with per-recipient groups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, nargs='+', default=[10, 100, 1000],
+                            help='numbers of connected sockets to measure')
+        parser.add_argument('--events', type=int, default=200, help='notifications sent per run')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"connections":>12} {"mode":>10} {"delivered":>10} {"ms total":>10} {"us/event":>10}')
+        for connections in options['connections']:
+            for mode in ('global', 'per-user'):
+                delivered, seconds = asyncio.get_event_loop().run_until_complete(
+                    self.run(mode, connections, options['events']))
+                self.stdout.write(f'{connections:>12} {mode:>10} {delivered:>10} {seconds * 1000:>10.1f} '
+                                  f'{seconds * 1e6 / options["events"]:>10.1f}')
+
+    @staticmethod
+    async def run(mode, connections, events):
+        """one socket per user, every event goes to one random recipient, returns (messages queued, seconds)"""
+        layer = InMemoryChannelLayer(capacity=events + 1, expiry=3600)
+        channels = [await layer.new_channel() for _ in range(connections)]
+        for user, channel in enumerate(channels):
+            group = 'notifications' if mode == 'global' else f'notifications-{user}'
+            await layer.group_add(group, channel)
+
+        recipients = [random.randrange(connections) for _ in range(events)]
+        started = time.perf_counter()
+        for recipient in recipients:
+            group = 'notifications' if mode == 'global' else f'notifications-{recipient}'
+            await layer.group_send(group, {'type': 'notify', 'key': 'notification', 'recipient': recipient})
+        # what the sockets have to drain, each of them is a frame serialized and sent to a browser
+        delivered = 0
+        for channel in channels:
+            queued = layer.channels.get(channel)
+            for _ in range(queued.qsize() if queued is not None else 0):
+                await layer.receive(channel)
+                delivered += 1
+        return delivered, time.perf_counter() - started
@@ -1,13 +1,16 @@
 from __future__ import unicode_literals
+import json
 import uuid
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
-from django.core import serializers
+from django.utils import timezone
 
 from slugify import slugify
 
+from zihu_clone.notifications.unread import LATEST_LIMIT, reset_unread, shift_unread
+
 class NotificationQuerySet(models.query.QuerySet):
 
     def unread(self):
@@ -16,28 +19,55 @@ class NotificationQuerySet(models.query.QuerySet):
     def read(self):
         return self.filter(unread=False).select_related('actor', 'recipient')
 
+    def with_action_objects(self):
+        """resolve action_object for the whole list with one query per content type instead of one per row
+
+        GenericForeignKey prefetching groups the rows by content_type and loads each model's objects by pk.
+        """
+        return self.prefetch_related('action_object')
+
+    def _recipient_ids(self):
+        return list(self.order_by().values_list('recipient_id', flat=True).distinct())
+
     def mark_all_as_read(self, recipient=None):
         qs = self.unread()
         if recipient:
             qs = qs.filter(recipient=recipient)
-        return qs.update(unread=False)
+        recipients = qs._recipient_ids()
+        marked = qs.update(unread=False, updated_at=timezone.now())
+        reset_unread(*recipients)
+        return marked
 
     def mark_all_as_unread(self, recipient=None):
         qs = self.read()
         if recipient:
             qs = qs.filter(recipient=recipient)
-        return qs.update(unread=True)
+        recipients = qs._recipient_ids()
+        marked = qs.update(unread=True, updated_at=timezone.now())
+        reset_unread(*recipients)
+        return marked
+
+    def mark_as_read(self, slugs):
+        """mark the notifications with the given slugs as read in a single UPDATE, returns how many changed"""
+        qs = self.filter(unread=True, slug__in=list(slugs))
+        recipients = qs._recipient_ids()
+        marked = qs.update(unread=False, updated_at=timezone.now())
+        if len(recipients) == 1:
+            shift_unread(recipients[0], -marked)
+        else:
+            reset_unread(*recipients)
+        return marked
 
     def get_most_recent(self, recipient=None):
-        qs = self.unread()[:5]
+        qs = self.unread().with_action_objects()
         if recipient:
-            qs = qs.filter(recipient=recipient)[:5]
-        return qs
+            qs = qs.filter(recipient=recipient)
+        return qs[:LATEST_LIMIT]
 
     def serialize_latest_notifications(self, recipient=None):
-        qs = self.get_most_recent(recipient)
-        notification_dic = serializers.serialize('json', qs)
-        return notification_dic
+        """compact json of the most recent unread notifications"""
+        return json.dumps([n.to_payload() for n in self.get_most_recent(recipient)], separators=(',', ':'))
+
 
 class Notification(models.Model):
     """参考：https://github.com/django-notifications/django-notifications"""
@@ -59,6 +89,9 @@ class Notification(models.Model):
     unread = models.BooleanField(default=True, verbose_name='unread')
     slug = models.SlugField(max_length=80, null=True, blank=True, verbose_name='URL alias')
     verb = models.CharField(max_length=1, choices=NOTIFICATION_TYPE, verbose_name="notification category")
+    aggregate_count = models.IntegerField(default=1, verbose_name='actors folded into this notification')
+    actors = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='+', blank=True,
+                                    verbose_name='distinct actors folded into this notification')
     created_at = models.DateTimeField(db_index=True, auto_now_add=True, verbose_name='creation time')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='creation time')
 
@@ -73,24 +106,46 @@ class Notification(models.Model):
         verbose_name = "notifications"
         verbose_name_plural = verbose_name
         ordering = ("-created_at",)
+        indexes = [
+            models.Index(fields=['unread', 'created_at']),  # prune_notifications, old read rows
+            models.Index(fields=['recipient', '-created_at']),  # per user lists and the per user cap
+        ]
 
     def __str__(self):
+        actor = f'{self.actor} and {self.aggregate_count - 1} others' if self.aggregate_count > 1 else self.actor
         if self.action_object:
-            return f'{self.actor} {self.get_verb_display()} {self.action_object}'
-        return f'{self.actor} {self.get_verb_display()}'
+            return f'{actor} {self.get_verb_display()} {self.action_object}'
+        return f'{actor} {self.get_verb_display()}'
+
+    def make_slug(self):
+        return slugify(f'{self.recipient} {self.uuid_id} {self.verb}')
 
     def save(self, force_insert=False, force_update=False, using=None,
              update_fields=None):
         if not self.slug:
-            self.slug = slugify(f'{self.recipient} {self.uuid_id} {self.verb}')
-        super(Notification, self).save()
+            self.slug = self.make_slug()
+            if update_fields is not None:
+                update_fields = set(update_fields) | {'slug'}
+        super(Notification, self).save(force_insert, force_update, using, update_fields)
 
     def mark_as_read(self):
         if self.unread:
             self.unread = False
-            self.save()
+            self.save(update_fields=['unread', 'updated_at'])
+            shift_unread(self.recipient_id, -1)
 
     def mark_as_unread(self):
         if not self.unread:
             self.unread = True
-            self.save()
+            self.save(update_fields=['unread', 'updated_at'])
+            shift_unread(self.recipient_id, 1)
+
+    def to_payload(self):
+        return {
+            'slug': self.slug,
+            'actor': self.actor.username,
+            'verb': self.verb,
+            'text': str(self),
+            'count': self.aggregate_count,
+            'created_at': self.created_at.isoformat(),
+        }
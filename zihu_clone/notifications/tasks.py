@@ -0,0 +1,212 @@
+import datetime
+import logging
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from config import celery_app
+from zihu_clone.event_buffer import CacheEventBuffer
+from zihu_clone.notifications.groups import topic_group, user_group
+from zihu_clone.notifications.models import Notification
+from zihu_clone.notifications.unread import reset_unread, shift_unread
+
+NOTIFICATION_FLUSH_DELAY = 2  # 秒，窗口内的通知一次批量写入
+NOTIFICATION_AGGREGATE_WINDOW = datetime.timedelta(hours=1)  # 窗口内同一对象上的同类通知合并为一条
+NOTIFICATION_FLUSH_ATTEMPTS = 3  # 写入失败的一批通知最多尝试的次数，之后丢弃并记录日志
+
+PRUNE_TIME_BUDGET = 45  # 秒，低于 CELERY_TASK_SOFT_TIME_LIMIT，剩余部分留给下一次运行
+
+pending_notifications = CacheEventBuffer('notifications:pending')
+logger = logging.getLogger(__name__)
+
+
+def queue_notification(actor, recipient, verb, action_object, key='notification', id_value=None):
+    """buffer a notification, the first one of a window schedules the batched write"""
+    event = {
+        'actor_id': actor.pk,
+        'actor_name': actor.username,
+        'recipient_id': recipient.pk,
+        'verb': verb,
+        'content_type_id': ContentType.objects.get_for_model(action_object).pk,
+        'object_id': str(action_object.pk),
+        'key': key,
+        'id_value': id_value,
+    }
+    if pending_notifications.push(event):
+        flush_notifications.apply_async(countdown=NOTIFICATION_FLUSH_DELAY)
+
+
+def _group(events):
+    """collapse events on the same recipient, verb and object, keeping their actors in order"""
+    grouped = {}
+    for event in events:
+        target = (event['recipient_id'], event['verb'], event['content_type_id'], event['object_id'])
+        grouped.setdefault(target, []).append(event)
+    return grouped
+
+
+def _folded_actors(notifications):
+    """{notification pk: ids of the actors already counted in aggregate_count}"""
+    folded = {notification.pk: set() for notification in notifications}
+    for notification_id, user_id in Notification.actors.through.objects.filter(
+            notification_id__in=list(folded)).values_list('notification_id', 'user_id'):
+        folded[notification_id].add(user_id)
+    return folded
+
+
+@celery_app.task()
+def flush_notifications():
+    """write the buffered notifications, a batch whose write fails goes back to the buffer for the next flush"""
+    events = pending_notifications.drain()
+    if not events:
+        return 0
+    users = get_user_model().objects.in_bulk(
+        {event['recipient_id'] for event in events} | {event['actor_id'] for event in events})
+    # recipient or actor deleted in the meantime
+    events = [event for event in events if event['recipient_id'] in users and event['actor_id'] in users]
+    if not events:
+        return 0
+    try:
+        created = _write_notifications(events, users)
+    except Exception:
+        logger.exception('flushing %s notifications failed', len(events))
+        retry = [dict(event, attempts=event.get('attempts', 0) + 1) for event in events
+                 if event.get('attempts', 0) + 1 < NOTIFICATION_FLUSH_ATTEMPTS]
+        if pending_notifications.restore(retry):
+            flush_notifications.apply_async(countdown=NOTIFICATION_FLUSH_DELAY)
+        return 0
+
+    added = {event['recipient_id']: 0 for event in events}
+    for notification in created:
+        added[notification.recipient_id] += 1
+    for user_id, count in added.items():
+        shift_unread(user_id, count)
+    _push(events)
+    return len(events)
+
+
+def _write_notifications(events, users):
+    """fold events into unread rows of the aggregation window in one transaction, returns the new rows"""
+    grouped = _group(events)
+    now = timezone.now()
+
+    with transaction.atomic():
+        recent = Notification.objects.filter(
+            unread=True,
+            created_at__gte=now - NOTIFICATION_AGGREGATE_WINDOW,
+            recipient_id__in={target[0] for target in grouped},
+            object_id__in={target[3] for target in grouped},
+        ).order_by('created_at')
+        existing = {(n.recipient_id, n.verb, n.content_type_id, n.object_id): n for n in recent}
+
+        folded = _folded_actors([existing[target] for target in grouped if target in existing])
+
+        created, links = [], []
+        for target, target_events in grouped.items():
+            actors = list(dict.fromkeys(event['actor_id'] for event in target_events))
+            notification = existing.get(target)
+            if notification is not None:
+                known = folded[notification.pk]
+                if notification.actor_id not in known:  # a row written before actors were recorded
+                    links.append(Notification.actors.through(
+                        notification_id=notification.pk, user_id=notification.actor_id))
+                    known.add(notification.actor_id)
+                new_actors = [actor for actor in actors if actor not in known]
+                # created_at tracks the latest event, so the row moves back to the top of the list
+                Notification.objects.filter(pk=notification.pk).update(
+                    actor_id=actors[-1], aggregate_count=F('aggregate_count') + len(new_actors),
+                    created_at=now, updated_at=now)
+            else:
+                new_actors = actors
+                notification = Notification(
+                    actor_id=actors[-1], recipient=users[target[0]], verb=target[1],
+                    content_type_id=target[2], object_id=target[3], aggregate_count=len(actors))
+                notification.slug = notification.make_slug()  # bulk_create skips save()
+                created.append(notification)
+            links.extend(Notification.actors.through(notification_id=notification.pk, user_id=actor)
+                         for actor in new_actors)
+        Notification.objects.bulk_create(created)
+        Notification.actors.through.objects.bulk_create(links)
+    return created
+
+
+def _push(events):
+    """one frame per recipient, one social_update per changed news"""
+    channel_layer = get_channel_layer()
+    for recipient_id, event in {event['recipient_id']: event for event in events}.items():
+        async_to_sync(channel_layer.group_send)(user_group(recipient_id), {
+            'type': 'notify',
+            'key': 'notification',
+            'actor_name': event['actor_name'],
+            'id_value': event['id_value'],
+        })
+    for id_value in dict.fromkeys(event['id_value'] for event in events if event['key'] == 'social_update'):
+        async_to_sync(channel_layer.group_send)(topic_group('news'), {
+            'type': 'notify',
+            'key': 'social_update',
+            'id_value': id_value,
+        })
+
+
+def _delete_chunks(queryset, chunk_size, deadline):
+    """delete queryset chunk by chunk in (created_at, pk) order, each chunk a short transaction of its own
+
+    every chunk seeks past the last row of the previous one instead of scanning from the start again,
+    the (unread, created_at) index serves both the filter and the order.
+    """
+    deleted, last = 0, None
+    while time.monotonic() < deadline:
+        chunk = queryset.order_by('created_at', 'pk')
+        if last is not None:
+            chunk = chunk.filter(Q(created_at__gt=last[0]) | Q(created_at=last[0], pk__gt=last[1]))
+        rows = list(chunk.values_list('created_at', 'pk')[:chunk_size])
+        if not rows:
+            break
+        deleted += Notification.objects.filter(pk__in=[pk for _, pk in rows]).delete()[0]
+        last = rows[-1]
+    return deleted
+
+
+@celery_app.task()
+def prune_notifications():
+    """apply the retention policy: drop old read notifications, then cap every user's notifications"""
+    started = time.monotonic()
+    deadline = started + PRUNE_TIME_BUDGET
+    chunk_size = settings.NOTIFICATION_PRUNE_CHUNK_SIZE
+    max_per_user = settings.NOTIFICATION_MAX_PER_USER
+    cutoff = timezone.now() - datetime.timedelta(days=settings.NOTIFICATION_READ_MAX_AGE_DAYS)
+
+    expired = _delete_chunks(Notification.objects.filter(unread=False, created_at__lt=cutoff),
+                             chunk_size, deadline)
+
+    over_cap, capped_users = 0, []
+    crowded = Notification.objects.order_by().values('recipient_id').annotate(
+        total=Count('pk')).filter(total__gt=max_per_user).values_list('recipient_id', flat=True)
+    for recipient_id in crowded:
+        if time.monotonic() >= deadline:
+            break
+        while time.monotonic() < deadline:
+            pks = list(Notification.objects.filter(recipient_id=recipient_id).order_by(
+                '-created_at', '-pk').values_list('pk', flat=True)[max_per_user:max_per_user + chunk_size])
+            if not pks:
+                break
+            over_cap += Notification.objects.filter(pk__in=pks).delete()[0]
+        capped_users.append(recipient_id)
+    reset_unread(*capped_users)  # the cap may remove unread rows
+
+    metrics = {
+        'expired': expired,
+        'over_cap': over_cap,
+        'capped_users': len(capped_users),
+        'seconds': round(time.monotonic() - started, 3),
+        'complete': time.monotonic() < deadline,
+    }
+    logger.info('notifications pruned: %s', metrics)
+    return metrics
@@ -0,0 +1,46 @@
+import pytest
+from django.core.cache import cache
+
+from zihu_clone.notifications.models import Notification
+from zihu_clone.notifications.unread import get_latest
+from zihu_clone.notifications.views import NotificationUnreadListView
+from zihu_clone.qa.models import Answer, Question
+from zihu_clone.users.tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def notified(user):
+    """unread notifications of user on questions and on answers, two content types of action objects"""
+    for i in range(3):
+        question = Question.objects.create(user=user, title=f'question {i}', content='content')
+        answer = Answer.objects.create(user=user, question=question, content=f'answer {i}')
+        Notification.objects.create(actor=UserFactory(), recipient=user, verb='L', action_object=question)
+        Notification.objects.create(actor=UserFactory(), recipient=user, verb='A', action_object=answer)
+    cache.clear()  # counters and payloads are read from the database below
+    return user
+
+
+def test_unread_list_queries_per_content_type(rf, notified, django_assert_num_queries):
+    request = rf.get('/notifications/')
+    request.user = notified
+    view = NotificationUnreadListView()
+    view.request, view.args, view.kwargs = request, (), {}
+
+    # notifications with actors, then one query for questions and one for answers
+    with django_assert_num_queries(3):
+        texts = [str(notification) for notification in view.get_queryset()]
+    assert len(texts) == 6
+
+
+def test_latest_notifications_queries_per_content_type(notified, django_assert_num_queries):
+    with django_assert_num_queries(3):
+        texts = [str(notification) for notification in notified.notifications.get_most_recent()]
+    assert len(texts) == 5
+
+    with django_assert_num_queries(3):
+        payloads = get_latest(notified.pk)
+    assert len(payloads) == 5
+    with django_assert_num_queries(0):  # served from the cache
+        assert get_latest(notified.pk) == payloads
@@ -0,0 +1,66 @@
+"""per-user unread notification counters and latest-notifications payloads kept in the cache
+
+counters are shifted where notifications are created or read. anything that cannot tell by how much
+drops the entry instead, and the next read recounts it from the database. a recount only stores its
+result when no write touched the user while it ran, the counter only feeds the navbar badge.
+"""
+import uuid
+
+from django.core.cache import cache
+
+UNREAD_TIMEOUT = 60 * 10  # 过期后从数据库重新统计，纠正可能的偏差
+LATEST_TIMEOUT = 60 * 5
+LATEST_LIMIT = 5
+
+
+def _count_key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def _latest_key(user_id):
+    return f'notifications:latest:{user_id}'
+
+
+def _recount_key(user_id):
+    return f'notifications:unread:{user_id}:recount'
+
+
+def get_unread_count(user_id):
+    from zihu_clone.notifications.models import Notification
+
+    count = cache.get(_count_key(user_id))
+    if count is None:
+        token = uuid.uuid4().hex
+        cache.set(_recount_key(user_id), token, UNREAD_TIMEOUT)
+        count = Notification.objects.filter(recipient_id=user_id, unread=True).count()
+        if cache.get(_recount_key(user_id)) == token:  # a write in between dropped the token, count again later
+            cache.add(_count_key(user_id), count, UNREAD_TIMEOUT)
+    return count
+
+
+def shift_unread(user_id, delta):
+    """add delta to a cached counter, a counter that is not cached stays so until recounted"""
+    cache.delete_many([_latest_key(user_id), _recount_key(user_id)])
+    try:
+        if cache.incr(_count_key(user_id), delta) < 0:
+            cache.delete(_count_key(user_id))
+    except ValueError:  # not cached
+        pass
+
+
+def reset_unread(*user_ids):
+    """forget the counters and latest payloads of user_ids, they are recounted on the next read"""
+    cache.delete_many([key for user_id in user_ids
+                       for key in (_count_key(user_id), _latest_key(user_id), _recount_key(user_id))])
+
+
+def get_latest(user_id):
+    """compact dicts of the LATEST_LIMIT most recent unread notifications of user_id"""
+    from zihu_clone.notifications.models import Notification
+
+    latest = cache.get(_latest_key(user_id))
+    if latest is None:
+        latest = [n.to_payload() for n in Notification.objects.filter(
+            recipient_id=user_id).get_most_recent()]
+        cache.set(_latest_key(user_id), latest, LATEST_TIMEOUT)
+    return latest
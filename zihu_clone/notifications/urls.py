@@ -6,7 +6,9 @@ app_name = 'notifications'
 
 urlpatterns = [
     path('', views.NotificationUnreadListView.as_view(), name='unread'),
+    path('mark-as-read/', views.mark_selected_as_read, name='mark_selected_read'),
     path('mark-as-read/<str:slug>/', views.mark_as_read, name='mark_as_read'),
     path('mark-all-as-read/', views.mark_all_as_read, name='mark_all_read'),
+    path('unread/', views.get_unread_notifications, name='unread_notifications'),
     path('latest-notifications/', views.get_latest_notifications, name='latest_notifications'),
 ]
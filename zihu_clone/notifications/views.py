@@ -2,20 +2,22 @@
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db import transaction
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import require_http_methods
 from django.views.generic import ListView
 
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-
 from zihu_clone.notifications.models import Notification
+from zihu_clone.notifications.tasks import queue_notification
+from zihu_clone.notifications.unread import get_latest, get_unread_count
 class NotificationUnreadListView(LoginRequiredMixin, ListView):
     model = Notification
     context_object_name = 'notification_list'
     template_name = 'notifications/notification_list.html'
 
     def get_queryset(self, **kwargs):
-        return self.request.user.notifications.unread()
+        return self.request.user.notifications.unread().with_action_objects()
 
 
 @login_required
@@ -46,6 +48,23 @@ def mark_as_read(request, slug):
     return redirect('notifications:unread')
 
 
+@login_required
+@require_http_methods(["POST"])
+def mark_selected_as_read(request):
+    """mark the notifications whose slugs are posted as slugs[] read with one UPDATE"""
+    slugs = request.POST.getlist('slugs[]')[:100]
+    return JsonResponse({'marked': request.user.notifications.mark_as_read(slugs)})
+
+
+@login_required
+def get_unread_notifications(request):
+    """unread count for the navbar badge and the latest unread notifications as compact json, from the cache"""
+    return JsonResponse({
+        'unread': get_unread_count(request.user.pk),
+        'notifications': get_latest(request.user.pk),
+    })
+
+
 @login_required
 def get_latest_notifications(request):
     notifications = request.user.notifications.get_most_recent()
@@ -54,21 +73,8 @@ def get_latest_notifications(request):
 
 
 def notification_handler(actor, recipient, verb, action_object, **kwargs):
+    """queue a notification, flush_notifications writes it in bulk and pushes it after the request commits"""
     if actor.username != recipient.username and recipient.username == action_object.user.username:
         key = kwargs.get('key', 'notification')
         id_value = kwargs.get('id_value', None)
-        Notification.objects.create(
-            actor=actor,
-            recipient=recipient,
-            verb=verb,
-            action_object=action_object
-        )
-
-        channel_layer = get_channel_layer()
-        payload = {
-            'type': 'receive',
-            'key': key,
-            'actor_name': actor.username,
-            'id_value': id_value
-        }
-        async_to_sync(channel_layer.group_send)('notifications', payload)
+        transaction.on_commit(lambda: queue_notification(actor, recipient, verb, action_object, key, id_value))
@@ -0,0 +1,141 @@
+import base64
+import datetime
+import json
+import uuid
+
+from django.db.models import Q
+from django.http import Http404
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage(object):
+    """one page of a keyset paginated queryset, quacks like django's Page where templates need it"""
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    # the opaque cursors stand in for page numbers, so "?page={{ page_obj.next_page_number }}" keeps working
+    def next_page_number(self):
+        return self.next_cursor
+
+    def previous_page_number(self):
+        return self.previous_cursor
+
+
+class CursorPaginator(object):
+    """keyset pagination: seek past the last row seen instead of OFFSET-ing over every row before it
+
+    ordering must be unique, so end it with the primary key as tiebreaker, e.g. ('-created_at', '-pk').
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-pk')):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = [self._get_field(name.lstrip('-')) for name in self.ordering]
+
+    def _get_field(self, name):
+        opts = self.queryset.model._meta
+        return opts.pk if name == 'pk' else opts.get_field(name)
+
+    @staticmethod
+    def _reverse(ordering):
+        return tuple(name[1:] if name.startswith('-') else f'-{name}' for name in ordering)
+
+    def _seek(self, values, ordering):
+        """rows strictly after values in the given ordering"""
+        condition = Q()
+        for i, name in enumerate(ordering):
+            field = name.lstrip('-')
+            lookup = f'{field}__lt' if name.startswith('-') else f'{field}__gt'
+            step = Q(**{lookup: values[i]})
+            for prior, value in zip(ordering[:i], values[:i]):
+                step &= Q(**{prior.lstrip('-'): value})
+            condition |= step
+        return condition
+
+    def encode_cursor(self, obj, backwards=False):
+        values = []
+        for name in self.ordering:
+            value = getattr(obj, name.lstrip('-'))
+            if isinstance(value, (datetime.datetime, datetime.date)):
+                value = value.isoformat()
+            elif isinstance(value, uuid.UUID):
+                value = str(value)
+            values.append(value)
+        raw = json.dumps({'v': values, 'b': backwards}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            data = json.loads(raw.decode('utf-8'))
+            values = data['v']
+            if len(values) != len(self.fields):
+                raise InvalidCursor(cursor)
+            return [field.to_python(value) for field, value in zip(self.fields, values)], bool(data['b'])
+        except InvalidCursor:
+            raise
+        except Exception as e:  # bad base64/json, or ValidationError from to_python
+            raise InvalidCursor(cursor) from e
+
+    def page(self, cursor=None):
+        values, backwards = self.decode_cursor(cursor) if cursor else (None, False)
+        ordering = self._reverse(self.ordering) if backwards else self.ordering
+        qs = self.queryset.order_by(*ordering)
+        if values is not None:
+            qs = qs.filter(self._seek(values, ordering))
+
+        rows = list(qs[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        next_cursor = self.encode_cursor(rows[-1]) if rows and has_next else None
+        previous_cursor = self.encode_cursor(rows[0], backwards=True) if rows and has_previous else None
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+
+class CursorPaginationMixin(object):
+    """drop-in replacement of ListView's OFFSET pagination, the page query parameter carries the cursor"""
+    cursor_ordering = ('-created_at', '-pk')
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = CursorPaginator(queryset, page_size, self.cursor_ordering)
+        cursor = self.kwargs.get(self.page_kwarg) or self.request.GET.get(self.page_kwarg)
+        try:
+            page = paginator.page(cursor)
+        except InvalidCursor:
+            raise Http404('invalid page cursor')
+        return paginator, page, page.object_list, page.has_other_pages()
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class QaConfig(AppConfig):
     name = 'zihu_clone.qa'
     verbose_name = 'Q&A'
+
+    def ready(self):
+        import zihu_clone.qa.signals  # noqa F401
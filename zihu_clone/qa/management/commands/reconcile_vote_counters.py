@@ -0,0 +1,25 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+
+from zihu_clone.qa.models import Answer, Question, Vote
+
+
+class Command(BaseCommand):
+    help = 'recount score, upvote_count and downvote_count of questions and answers from the Vote table'
+
+    def handle(self, *args, **options):
+        for model in (Question, Answer):
+            counted = {
+                row['object_id']: (row['up'], row['down'])
+                for row in Vote.objects.filter(content_type=ContentType.objects.get_for_model(model)).values(
+                    'object_id').annotate(up=Count('pk', filter=Q(value=True)), down=Count('pk', filter=Q(value=False)))
+            }
+            fixed = 0
+            for pk, up, down in model.objects.values_list('pk', 'upvote_count', 'downvote_count').iterator():
+                actual_up, actual_down = counted.get(str(pk), (0, 0))
+                if (up, down) != (actual_up, actual_down):
+                    model.objects.filter(pk=pk).update(
+                        upvote_count=actual_up, downvote_count=actual_down, score=actual_up - actual_down)
+                    fixed += 1
+            self.stdout.write(f'{model._meta.label}: reconciled {fixed} rows')
@@ -1,15 +1,50 @@
 from __future__ import unicode_literals
 import uuid
-from collections import Counter
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericRelation, GenericForeignKey
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
 
 from slugify import slugify
 from markdownx.models import MarkdownxField
 from taggit.managers import TaggableManager
-from markdownx.utils import markdownify
+
+from zihu_clone.markdown_cache import MarkdownCacheModel
+from zihu_clone.qa.vote_buffer import buffered_toggle, get_vote_buffer
+from zihu_clone.tags import POPULAR_TAGS_LIMIT, get_counted_tags
+
+
+class VoteQuerySet(models.query.QuerySet):
+
+    def toggle(self, user, model, object_id, value):
+        """one click on an up/down button: a new vote, a flip, or withdrawing the same vote
+
+        the (user, content_type, object_id) row is locked while deciding, so concurrent clicks queue up
+        instead of losing counter updates; returns the new score read from the maintained counters.
+        """
+        content_type = ContentType.objects.get_for_model(model)
+        object_id = str(model._meta.pk.to_python(object_id))
+        buffer = get_vote_buffer()
+        if buffer is not None:
+            return buffered_toggle(buffer, user, model, object_id, value)
+        with transaction.atomic():
+            vote = self.select_for_update().filter(
+                user=user, content_type=content_type, object_id=object_id).first()
+            if vote is None:
+                try:
+                    with transaction.atomic():
+                        self.create(user=user, content_type=content_type, object_id=object_id, value=value)
+                except IntegrityError:  # a concurrent first click won, decide again against its row
+                    return self.toggle(user, model, object_id, value)
+            elif vote.value == value:
+                vote.delete()
+            else:
+                vote.value = value
+                vote.save(update_fields=['value', 'updated_at'])
+            # raises DoesNotExist for a missing object, rolling the vote back with it
+            return model.objects.values_list('score', flat=True).get(pk=object_id)
 
 
 class Vote(models.Model):
@@ -25,6 +60,8 @@ class Vote(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='creation time')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='update time')
 
+    objects = VoteQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Vote'
         verbose_name_plural = verbose_name
@@ -32,6 +69,32 @@ class Vote(models.Model):
         #SQL optimization
         index_together = ('content_type', 'object_id')
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Vote, cls).from_db(db, field_names, values)
+        # remember the stored value so a flip can be told apart from a re-save
+        instance._loaded_value = instance.value
+        return instance
+
+    def counter_delta(self, value, sign=1):
+        """apply sign * one vote of the given value to the score columns of the voted object"""
+        model = ContentType.objects.get_for_id(self.content_type_id).model_class()
+        up, down = (sign, 0) if value else (0, sign)
+        apply_vote_counts(model, self.object_id, up, down)
+
+
+def apply_vote_counts(model, object_id, up, down):
+    """shift the counters of a voted question or answer in SQL, so concurrent voters never lose updates"""
+    updates = {
+        'upvote_count': F('upvote_count') + up,
+        'downvote_count': F('downvote_count') + down,
+        'score': F('score') + up - down,
+    }
+    if model is Question:
+        updates['last_activity'] = timezone.now()
+    model.objects.filter(pk=object_id).update(**updates)
+
+
 class QuestionQuerySet(models.query.QuerySet):
     def get_answered(self):
         return self.filter(has_answer=True).select_related('user')
@@ -39,18 +102,11 @@ class QuestionQuerySet(models.query.QuerySet):
     def get_unanswered(self):
         return self.filter(has_answer=False).select_related('user')
 
-    def get_counted_tags(self):
-        tag_dict = {}
-        for obj in self.all():
-            for tag in obj.tags.names():
-                if tag not in tag_dict:
-                    tag_dict[tag] = 1
-
-                else:
-                    tag_dict[tag] += 1
-        return tag_dict.items()
+    def get_hot(self):
+        """ranked by the hot_score precomputed by the update_hot_questions beat task"""
+        return self.filter(hot_score__gt=0).select_related('user')
 
-class Question(models.Model):
+class Question(MarkdownCacheModel):
     STATUS = (("O", "Open"), ("C", "Close"), ("D", "Draft"))
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="q_author",
@@ -63,8 +119,13 @@ class Question(models.Model):
     tags = TaggableManager(help_text='use comma(,) to seperate multiple tags', verbose_name='tags')
     has_answer = models.BooleanField(default=False, verbose_name="accepted answer")
     votes = GenericRelation(Vote, verbose_name='vote result')
+    score = models.IntegerField(default=0, db_index=True, verbose_name='vote score')
+    upvote_count = models.IntegerField(default=0, verbose_name='upvotes')
+    downvote_count = models.IntegerField(default=0, verbose_name='downvotes')
+    hot_score = models.FloatField(default=0, db_index=True, verbose_name='hot ranking score')
+    last_activity = models.DateTimeField(db_index=True, default=timezone.now, verbose_name='last vote or answer')
     created_at = models.DateTimeField(db_index=True, auto_now_add=True, verbose_name='creation time')
-    updated_at = models.DateTimeField(auto_now=True, verbose_name='update time')
+    updated_at = models.DateTimeField(db_index=True, auto_now=True, verbose_name='update time')  # similarity sync
 
     objects = QuestionQuerySet.as_manager()
 
@@ -81,26 +142,55 @@ class Question(models.Model):
     def __str__(self):
         return self.title
 
-    def get_markdown(self):
-        return markdownify(self.content)
+    @classmethod
+    def get_popular_tags(cls, limit=POPULAR_TAGS_LIMIT):
+        """site wide top tags of open questions as (name, count) pairs, aggregated in SQL and cached"""
+        return get_counted_tags(cls.objects.filter(status="O"), limit)
 
     def total_votes(self):
-        dic = Counter(self.votes.values_list('value', flat=True))
-        return dic[True] - dic[False]
+        return self.score
 
     def get_answers(self):
+        if hasattr(self, '_loaded_answers'):
+            return self._loaded_answers
         return Answer.objects.filter(question=self).select_related('user', 'question')
 
     def count_answers(self):
+        if hasattr(self, '_loaded_answers'):
+            return len(self._loaded_answers)
         return self.get_answers().count()
 
+    def load_answers(self, user):
+        """load the answers of the detail page with user's votes attached as user_vote (True, False or None)
+
+        one query for answers and their authors, one for every vote of user on the page,
+        scores come from the maintained counters, so the cost does not grow with the number of answers.
+        """
+        answers = list(Answer.objects.filter(question=self).select_related('user'))
+        for answer in answers:
+            answer.question = self
+        votes = dict(Vote.objects.filter(
+            Q(content_type=ContentType.objects.get_for_model(Question), object_id=str(self.pk)) |
+            Q(content_type=ContentType.objects.get_for_model(Answer), object_id__in=[str(a.pk) for a in answers]),
+            user=user,
+        ).values_list('object_id', 'value'))  # question pks are integers, answer pks uuids, they never clash
+        self.user_vote = votes.get(str(self.pk))
+        for answer in answers:
+            answer.user_vote = votes.get(str(answer.pk))
+        buffer = get_vote_buffer()
+        if buffer is not None:
+            buffer.overlay(user, [self])
+            buffer.overlay(user, answers)
+        self._loaded_answers = answers
+        return answers
+
     def get_upvoters(self):
-        return [vote.user for vote in self.votes.filter(value=True).select_related('user').prefecth_related('vote')]
+        return [vote.user for vote in self.votes.filter(value=True).select_related('user')]
 
     def get_downvoters(self):
-        return [vote.user for vote in self.votes.filter(value=False).select_related('user').prefecth_related('vote')]
+        return [vote.user for vote in self.votes.filter(value=False).select_related('user')]
 
-class Answer(models.Model):
+class Answer(MarkdownCacheModel):
     uuid_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='a_author', on_delete=models.CASCADE,
                              verbose_name='answer')
@@ -108,6 +198,9 @@ class Answer(models.Model):
     content = MarkdownxField(verbose_name='content')
     is_answer = models.BooleanField(default=False, verbose_name='whether the answer is accepted')
     votes = GenericRelation(Vote, verbose_name='vote result')
+    score = models.IntegerField(default=0, db_index=True, verbose_name='vote score')
+    upvote_count = models.IntegerField(default=0, verbose_name='upvotes')
+    downvote_count = models.IntegerField(default=0, verbose_name='downvotes')
     created_at = models.DateTimeField(db_index=True, auto_now_add=True, verbose_name='creation time')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='update time')
 
@@ -119,23 +212,20 @@ class Answer(models.Model):
     def __str__(self):
         return self.content
 
-    def get_markdown(self):
-        return markdownify(self.content)
-
     def total_votes(self):
-        dic = Counter(self.votes.values_list('value', flat=True))
-        return dic[True] - dic[False]
+        return self.score
 
     def get_upvoters(self):
-        return [vote.user for vote in self.votes.filter(value=True).select_related('user').prefecth_related('vote')]
+        return [vote.user for vote in self.votes.filter(value=True).select_related('user')]
 
     def get_downvoters(self):
-        return [vote.user for vote in self.votes.filter(value=False).select_related('user').prefecth_related('vote')]
+        return [vote.user for vote in self.votes.filter(value=False).select_related('user')]
 
     def accept_answer(self):
         answer_set = Answer.objects.filter(question=self.question)
         answer_set.update(is_answer=False)
         self.is_answer = True
-        self.save()
+        # update_fields keeps a full save from writing back stale vote counters
+        self.save(update_fields=['is_answer', 'updated_at'])
         self.question.has_answer = True
-        self.question.save()
\ No newline at end of file
+        self.question.save(update_fields=['has_answer', 'updated_at'])
@@ -0,0 +1,57 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.db import transaction
+from django.utils import timezone
+
+from taggit.models import TaggedItem
+
+from zihu_clone.qa import similarity
+from zihu_clone.qa.models import Answer, Question, Vote
+from zihu_clone.tags import invalidate_counted_tags
+
+
+@receiver(m2m_changed, sender=TaggedItem)
+def question_tags_changed(sender, instance, action, **kwargs):
+    if isinstance(instance, Question) and action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_counted_tags(Question)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_changed(sender, **kwargs):
+    """status changes move a question in or out of the open tag counts"""
+    invalidate_counted_tags(Question)
+
+
+@receiver(post_save, sender=Question)
+def question_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: similarity.index_question(instance))
+
+
+@receiver(post_delete, sender=Question)
+def question_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: similarity.unindex_question(instance))
+
+
+@receiver(post_save, sender=Vote)
+def vote_saved(sender, instance, created, **kwargs):
+    """keep score, upvote_count and downvote_count in the voter's transaction"""
+    previous = getattr(instance, '_loaded_value', None)
+    if created:
+        instance.counter_delta(instance.value)
+    elif previous is not None and previous != instance.value:
+        instance.counter_delta(previous, -1)
+        instance.counter_delta(instance.value)
+    instance._loaded_value = instance.value
+
+
+@receiver(post_delete, sender=Vote)
+def vote_deleted(sender, instance, **kwargs):
+    instance.counter_delta(instance.value, -1)
+
+
+@receiver(post_save, sender=Answer)
+def answer_posted(sender, instance, created, **kwargs):
+    """a new answer makes the question a candidate for the next hot ranking pass"""
+    if created:
+        Question.objects.filter(pk=instance.question_id).update(last_activity=timezone.now())
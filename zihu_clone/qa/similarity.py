@@ -0,0 +1,167 @@
+"""in-process similar question lookup, MinHash signatures of title shingles bucketed by LSH
+
+each process builds its own index once, from the titles in the database by a background thread, so
+lookups never wait for a build. afterwards the save/delete signals keep it current for this process,
+and questions added or edited by other processes are picked up on lookup by an updated_at delta
+query. a question deleted elsewhere stays indexed but is dropped when the matches are loaded.
+"""
+import datetime
+import random
+import re
+import threading
+import zlib
+
+from django.db import connection
+from django.utils import timezone
+
+from zihu_clone.qa.models import Question
+
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+BANDS = 16  # BANDS * ROWS == NUM_PERM，约 0.3 的 Jaccard 相似度即可命中同一个桶
+ROWS = 4
+PRIME = (1 << 61) - 1
+SYNC_OVERLAP = datetime.timedelta(seconds=5)  # 进程间时钟偏差的余量，重复处理的行不影响结果
+SIMILAR_LIMIT = 5
+
+_random = random.Random(20190401)  # 固定种子，签名在所有进程中一致
+PERMUTATIONS = [(_random.randrange(1, PRIME), _random.randrange(0, PRIME)) for _ in range(NUM_PERM)]
+
+
+def shingles(text):
+    """character trigrams of the lowercased text, works for chinese titles as well as english ones"""
+    text = re.sub(r'\s+', ' ', text.lower()).strip()
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(shingle_set):
+    hashes = [zlib.crc32(s.encode('utf-8')) for s in shingle_set]
+    return tuple(min((a * h + b) % PRIME for h in hashes) for a, b in PERMUTATIONS)
+
+
+def estimate_similarity(first, second):
+    """share of equal minimums estimates the Jaccard similarity of the two shingle sets"""
+    return sum(x == y for x, y in zip(first, second)) / NUM_PERM
+
+
+def bands(signature):
+    return [(band, signature[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+
+class SimilarityIndex(object):
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.signatures = {}
+        self.buckets = {}
+        self.synced_at = None  # titles updated before this are in the index, None until built
+
+    def add(self, pk, title):
+        shingle_set = shingles(title)
+        with self.lock:
+            self.remove(pk)
+            if not shingle_set:
+                return
+            signature = minhash(shingle_set)
+            self.signatures[pk] = signature
+            for bucket in bands(signature):
+                self.buckets.setdefault(bucket, set()).add(pk)
+
+    def remove(self, pk):
+        with self.lock:
+            signature = self.signatures.pop(pk, None)
+            if signature is None:
+                return
+            for bucket in bands(signature):
+                members = self.buckets.get(bucket)
+                if members is not None:
+                    members.discard(pk)
+                    if not members:
+                        del self.buckets[bucket]
+
+    def query(self, text, limit=SIMILAR_LIMIT, threshold=0.2):
+        """[(pk, estimated similarity)] of the indexed titles closest to text, best first"""
+        shingle_set = shingles(text)
+        if not shingle_set:
+            return []
+        signature = minhash(shingle_set)
+        with self.lock:
+            candidates = set()
+            for bucket in bands(signature):
+                candidates |= self.buckets.get(bucket, set())
+            scored = [(pk, estimate_similarity(signature, self.signatures[pk])) for pk in candidates]
+        scored = [(pk, score) for pk, score in scored if score >= threshold]
+        scored.sort(key=lambda item: (-item[1], -item[0]))
+        return scored[:limit]
+
+    def rebuild(self, rows, synced_at):
+        fresh = SimilarityIndex()
+        for pk, title in rows:
+            fresh.add(pk, title)
+        with self.lock:
+            self.signatures, self.buckets = fresh.signatures, fresh.buckets
+            self.synced_at = synced_at
+
+    def sync(self, rows, synced_at):
+        """re-add the (pk, title) rows updated since synced_at"""
+        for pk, title in rows:
+            self.add(pk, title)
+        with self.lock:
+            self.synced_at = max(self.synced_at, synced_at)
+
+
+_index = SimilarityIndex()
+_building = threading.Lock()
+_started = threading.Event()
+
+
+def _build():
+    try:
+        started = timezone.now()  # rows saved during the build are caught by the first sync
+        _index.rebuild(Question.objects.order_by().values_list('pk', 'title').iterator(), started)
+    except Exception:
+        _started.clear()  # let the next lookup try again
+        raise
+    finally:
+        connection.close()  # the thread's own connection
+
+
+def build_in_background():
+    """start building the process index, once"""
+    with _building:
+        if _started.is_set():
+            return
+        _started.set()
+    threading.Thread(target=_build, name='similar-questions-index', daemon=True).start()
+
+
+def get_similarity_index():
+    """the process index, empty until its background build finishes, then topped up with recent edits"""
+    if _index.synced_at is None:
+        build_in_background()
+        return _index
+    started = timezone.now()
+    _index.sync(Question.objects.filter(updated_at__gte=_index.synced_at - SYNC_OVERLAP).order_by().values_list(
+        'pk', 'title'), started)
+    return _index
+
+
+def index_question(question):
+    """signal hook, an index that was never built picks the question up when it is"""
+    if _index.synced_at is not None:
+        _index.add(question.pk, question.title)
+
+
+def unindex_question(question):
+    if _index.synced_at is not None:
+        _index.remove(question.pk)
+
+
+def find_similar_questions(text, limit=SIMILAR_LIMIT, exclude=None):
+    """questions with a title close to text, as dicts ready for a JsonResponse"""
+    matches = [(pk, score) for pk, score in get_similarity_index().query(text, limit + 1) if pk != exclude]
+    found = {row['pk']: row for row in Question.objects.filter(
+        pk__in=[pk for pk, _ in matches]).values('pk', 'title', 'has_answer')}
+    return [dict(found[pk], similarity=round(score, 2)) for pk, score in matches if pk in found][:limit]
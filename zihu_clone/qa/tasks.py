@@ -0,0 +1,70 @@
+import datetime
+import logging
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from config import celery_app
+from zihu_clone.qa.models import Question
+from zihu_clone.qa.vote_buffer import VOTE_BUFFER_FLUSH_DELAY, get_vote_buffer, write_votes
+
+logger = logging.getLogger(__name__)
+
+HOT_GRAVITY = 1.8
+HOT_ANSWER_WEIGHT = 2
+HOT_MAX_AGE = datetime.timedelta(days=7)  # 超过一周的问题不再参与热榜
+HOT_LIST_SIZE = 200
+HOT_LAST_RUN_KEY = 'qa:hot:last-run'
+
+
+def hot_score(score, answers, created_at, now):
+    """votes plus weighted answers, decayed by age in hours like hacker news"""
+    age_hours = max((now - created_at).total_seconds(), 0) / 3600
+    return (score + HOT_ANSWER_WEIGHT * answers) / pow(age_hours + 2, HOT_GRAVITY)
+
+
+@celery_app.task()
+def update_hot_questions():
+    """recompute hot_score of questions active since the last run, plus the ranked list itself so it decays"""
+    now = timezone.now()
+    since = cache.get(HOT_LAST_RUN_KEY) or now - HOT_MAX_AGE
+    cutoff = now - HOT_MAX_AGE
+
+    expired = Question.objects.filter(created_at__lt=cutoff).exclude(hot_score=0).update(hot_score=0)
+
+    ranked = list(Question.objects.filter(hot_score__gt=0).order_by('-hot_score').values_list(
+        'pk', flat=True)[:HOT_LIST_SIZE])
+    candidates = Question.objects.filter(
+        Q(last_activity__gte=since) | Q(pk__in=ranked),
+        created_at__gte=cutoff,
+    ).annotate(answers=Count('answer')).values_list('pk', 'score', 'answers', 'created_at')
+
+    updated = 0
+    for pk, score, answers, created_at in candidates:
+        Question.objects.filter(pk=pk).update(hot_score=hot_score(score, answers, created_at, now))
+        updated += 1
+    cache.set(HOT_LAST_RUN_KEY, now, None)
+    return {'updated': updated, 'expired': expired}
+
+
+@celery_app.task()
+def flush_vote_buffer():
+    """write every buffered vote to the Vote table, an object whose write fails is put back for the next flush"""
+    buffer = get_vote_buffer()
+    if buffer is None:
+        return 0
+    buffer.release_flush()  # clicks from now on schedule the next flush
+    written = left = 0
+    for content_type_id, object_id, entries in buffer.drain():
+        try:
+            written += write_votes(content_type_id, object_id, entries)
+        except Exception:
+            logger.exception('flushing votes of %s:%s failed', content_type_id, object_id)
+            buffer.restore(content_type_id, object_id, entries)
+            left += 1
+        else:
+            left += buffer.commit(content_type_id, object_id, entries)  # write_votes has committed here
+    if left and buffer.claim_flush():
+        flush_vote_buffer.apply_async(countdown=VOTE_BUFFER_FLUSH_DELAY)
+    return written
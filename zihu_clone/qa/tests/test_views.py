@@ -0,0 +1,45 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from zihu_clone.qa.models import Answer, Question, Vote
+from zihu_clone.qa.views import QuestionDetailView
+from zihu_clone.users.tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def load_detail(rf, user, question):
+    """what the detail page queries, without rendering the template"""
+    request = rf.get(f'/qa/question-detail/{question.pk}/')
+    request.user = user
+    view = QuestionDetailView()
+    view.request, view.args, view.kwargs = request, (), {'pk': question.pk}
+    view.object = view.get_object()
+    return view.get_context_data(object=view.object)
+
+
+def make_question(answers):
+    question = Question.objects.create(user=UserFactory(), title=f'question with {answers} answers',
+                                       content='content')
+    for _ in range(answers):
+        answer = Answer.objects.create(user=UserFactory(), question=question, content='answer')
+        Vote.objects.toggle(UserFactory(), Answer, answer.pk, True)
+    return question
+
+
+def test_question_detail_queries_do_not_grow_with_answers(rf, user, django_assert_num_queries):
+    one, many = make_question(1), make_question(10)
+    Vote.objects.toggle(user, Question, many.pk, True)
+    load_detail(rf, user, one)  # warms the content type cache
+
+    with CaptureQueriesContext(connection) as queries:
+        context = load_detail(rf, user, one)
+    assert len(context['answers']) == 1
+
+    with django_assert_num_queries(len(queries)):
+        context = load_detail(rf, user, many)
+        for answer in context['answers']:
+            answer.user.get_profile_name(), answer.score, answer.user_vote, answer.get_markdown()
+    assert len(context['answers']) == 10
+    assert context['question'].user_vote is True
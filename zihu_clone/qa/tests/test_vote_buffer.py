@@ -0,0 +1,97 @@
+import pytest
+from django.contrib.contenttypes.models import ContentType
+
+from zihu_clone.qa import tasks
+from zihu_clone.qa.models import Answer, Question, Vote
+from zihu_clone.qa.vote_buffer import get_vote_buffer, write_votes
+from zihu_clone.users.tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def buffer(settings):
+    settings.QA_VOTE_BUFFER = 'zihu_clone.qa.vote_buffer.InMemoryVoteBuffer'
+    get_vote_buffer.cache_clear()
+    yield get_vote_buffer()
+    get_vote_buffer.cache_clear()
+
+
+@pytest.fixture
+def question(user):
+    return Question.objects.create(user=user, title='buffered votes', content='content')
+
+
+def assert_counters_match(obj):
+    obj.refresh_from_db()
+    votes = Vote.objects.filter(content_type=ContentType.objects.get_for_model(obj), object_id=str(obj.pk))
+    up, down = votes.filter(value=True).count(), votes.filter(value=False).count()
+    assert (obj.upvote_count, obj.downvote_count, obj.score) == (up, down, up - down)
+
+
+def test_click_is_overlaid_before_the_flush(buffer, user, question):
+    answer = Answer.objects.create(user=UserFactory(), question=question, content='answer')
+    assert Vote.objects.toggle(user, Question, question.pk, True) == 1
+    assert Vote.objects.toggle(user, Answer, answer.pk, False) == -1
+    assert not Vote.objects.exists()
+
+    question = Question.objects.get(pk=question.pk)
+    assert question.score == 0
+    answers = question.load_answers(user)
+    assert (question.score, question.upvote_count, question.user_vote) == (1, 1, True)
+    assert (answers[0].score, answers[0].downvote_count, answers[0].user_vote) == (-1, 1, False)
+
+
+def test_click_during_a_flush_is_rebased_on_commit(buffer, user, question):
+    Vote.objects.toggle(user, Question, question.pk, True)
+    (content_type_id, object_id, entries), = list(buffer.drain())
+    assert Vote.objects.toggle(user, Question, question.pk, False) == -1  # lands while the flush writes
+    assert list(buffer.drain()) == []  # still in flight
+
+    write_votes(content_type_id, object_id, entries)
+    assert buffer.commit(content_type_id, object_id, entries) == 1
+    assert buffer.pending(content_type_id, [object_id]) == {object_id: {user.pk: (True, False)}}
+
+    tasks.flush_vote_buffer()
+    assert Vote.objects.get().value is False
+    assert buffer.pending(content_type_id, [object_id]) == {}
+    assert_counters_match(question)
+
+
+def test_failed_write_is_restored(buffer, user, question, monkeypatch):
+    def broken(*args):
+        raise RuntimeError('database went away')
+
+    monkeypatch.setattr(tasks.flush_vote_buffer, 'apply_async', lambda *args, **kwargs: None)
+    monkeypatch.setattr(tasks, 'write_votes', broken)
+    Vote.objects.toggle(user, Question, question.pk, True)
+    assert tasks.flush_vote_buffer() == 0
+    content_type_id, object_id = ContentType.objects.get_for_model(Question).pk, str(question.pk)
+    assert buffer.pending(content_type_id, [object_id]) == {object_id: {user.pk: (None, True)}}
+
+    monkeypatch.setattr(tasks, 'write_votes', write_votes)
+    assert tasks.flush_vote_buffer() == 1
+    assert Vote.objects.get().value is True
+    assert_counters_match(question)
+
+
+def test_flush_leaves_counters_equal_to_vote_rows(buffer, question):
+    answer = Answer.objects.create(user=UserFactory(), question=question, content='answer')
+    voters = UserFactory.create_batch(5)
+    question_type = ContentType.objects.get_for_model(Question)
+    # votes written before the clicks, counted by the Vote signals
+    Vote.objects.create(user=voters[0], content_type=question_type, object_id=str(question.pk), value=True)
+    Vote.objects.create(user=voters[1], content_type=question_type, object_id=str(question.pk), value=False)
+
+    Vote.objects.toggle(voters[0], Question, question.pk, True)  # withdrawn, the post_delete receiver counts it
+    Vote.objects.toggle(voters[1], Question, question.pk, True)  # flipped
+    Vote.objects.toggle(voters[2], Question, question.pk, True)  # new
+    Vote.objects.toggle(voters[3], Question, question.pk, False)
+    Vote.objects.toggle(voters[3], Question, question.pk, False)  # withdrawn before the flush, never written
+    Vote.objects.toggle(voters[4], Answer, answer.pk, False)
+
+    tasks.flush_vote_buffer()
+    assert_counters_match(question)
+    assert_counters_match(answer)
+    assert (question.upvote_count, question.downvote_count, answer.score) == (2, 0, -1)
+    assert buffer.pending(question_type.pk, [str(question.pk)]) == {}
@@ -0,0 +1,46 @@
+import threading
+
+import pytest
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+
+from zihu_clone.qa.models import Question, Vote
+from zihu_clone.users.tests.factories import UserFactory
+
+VOTERS = 6
+CLICKS = 5
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_toggles_keep_counters_in_step_with_votes():
+    """every voter clicks up and down from two threads at once, the counters must still match the rows"""
+    if connection.vendor != 'postgresql':
+        pytest.skip('needs row locks, run against postgresql')
+    question = Question.objects.create(user=UserFactory(), title='concurrent votes', content='content')
+    voters = UserFactory.create_batch(VOTERS)
+    barrier = threading.Barrier(VOTERS * 2)
+    errors = []
+
+    def click(voter, value):
+        try:
+            barrier.wait()
+            for _ in range(CLICKS):
+                Vote.objects.toggle(voter, Question, question.pk, value)
+        except Exception as e:  # surfaced by the assertion below
+            errors.append(e)
+        finally:
+            connection.close()  # the thread's own connection
+
+    threads = [threading.Thread(target=click, args=(voter, value)) for voter in voters for value in (True, False)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    votes = Vote.objects.filter(content_type=ContentType.objects.get_for_model(Question), object_id=str(question.pk))
+    up, down = votes.filter(value=True).count(), votes.filter(value=False).count()
+    question.refresh_from_db()
+    assert (question.upvote_count, question.downvote_count) == (up, down)
+    assert question.score == up - down
+    assert votes.count() <= VOTERS
@@ -8,7 +8,9 @@ urlpatterns = [
     path('', views.UnansweredQuestionListView.as_view(), name='unanswered_q'),
     path('answered/', views.AnsweredQuestionListView.as_view(), name='answered_q'),
     path('indexed/', views.QuestionListView.as_view(), name='all_q'),
+    path('hot/', views.HotQuestionListView.as_view(), name='hot_q'),
     path('ask-question/', views.CreateQuestionView.as_view(), name='ask_question'),
+    path('similar-questions/', views.similar_questions, name='similar_questions'),
     path('question-detail/<int:pk>/', views.QuestionDetailView.as_view(), name='question_detail'),
     path('propose-answer/<int:question_id>/', views.CreateAnswerView.as_view(), name='propose_answer'),
     path('question/vote/', views.question_vote, name='question_vote'),
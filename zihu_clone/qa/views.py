@@ -11,10 +11,12 @@ from django.views.decorators.cache import cache_page
 from django.utils.decorators import method_decorator
 
 from zihu_clone.helpers import ajax_required
-from zihu_clone.qa.models import Question, Answer
+from zihu_clone.pagination import CursorPaginationMixin
+from zihu_clone.qa.models import Question, Answer, Vote
 from zihu_clone.qa.forms import QuestionForm
+from zihu_clone.qa.similarity import find_similar_questions
 from zihu_clone.notifications.views import notification_handler
-class QuestionListView(LoginRequiredMixin, ListView):
+class QuestionListView(LoginRequiredMixin, CursorPaginationMixin, ListView):
     queryset = Question.objects.select_related('user')
     paginate_by = 10
     context_object_name = "questions"
@@ -22,7 +24,7 @@ class QuestionListView(LoginRequiredMixin, ListView):
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super(QuestionListView, self).get_context_data()
-        context["popular_tags"] = Question.objects.get_counted_tags()
+        context["popular_tags"] = Question.get_popular_tags()
         context["active"] = "all"
         return context
 
@@ -48,6 +50,19 @@ class UnansweredQuestionListView(QuestionListView):
         return context
 
 
+class HotQuestionListView(QuestionListView):
+    """trending questions, served straight from the precomputed hot_score ordering"""
+    cursor_ordering = ('-hot_score', '-pk')
+
+    def get_queryset(self):
+        return Question.objects.get_hot()
+
+    def get_context_data(self, *, object_list=None, **kwargs):
+        context = super(HotQuestionListView, self).get_context_data()
+        context["active"] = "hot"
+        return context
+
+
 @method_decorator(cache_page(60 * 60), name='get')
 class CreateQuestionView(LoginRequiredMixin, CreateView):
     form_class = QuestionForm
@@ -71,6 +86,11 @@ class QuestionDetailView(LoginRequiredMixin, DetailView):
     def get_queryset(self):
         return Question.objects.select_related('user').filter(pk=self.kwargs['pk'])
 
+    def get_context_data(self, **kwargs):
+        context = super(QuestionDetailView, self).get_context_data(**kwargs)
+        context['answers'] = self.object.load_answers(self.request.user)
+        return context
+
 
 @method_decorator(cache_page(60 * 60), name='get')
 class CreateAnswerView(LoginRequiredMixin, CreateView):
@@ -95,15 +115,7 @@ class CreateAnswerView(LoginRequiredMixin, CreateView):
 def question_vote(request):
     question_id = request.POST["question"]
     value = True if request.POST["value"] == 'U' else False
-    question = Question.objects.get(pk=question_id)
-    users = question.votes.values_list('user', flat=True)
-
-    if request.user.pk in users and (question.votes.get(user=request.user).value == value):
-        question.votes.get(user=request.user).delete()
-    else:
-        question.votes.update_or_create(user=request.user, defaults={"value": value})
-
-    return JsonResponse({"votes": question.total_votes()})
+    return JsonResponse({"votes": Vote.objects.toggle(request.user, Question, question_id, value)})
 
 
 @login_required
@@ -113,15 +125,16 @@ def answer_vote(request):
     "send Ajax post request to vote on the answer"
     answer_id = request.POST["answer"]
     value = True if request.POST["value"] == 'U' else False
-    answer = Answer.objects.get(uuid_id=answer_id)
-    users = answer.votes.values_list('user', flat=True)
+    return JsonResponse({"votes": Vote.objects.toggle(request.user, Answer, answer_id, value)})
 
-    if request.user.pk in users and (answer.votes.get(user=request.user).value == value):
-        answer.votes.get(user=request.user).delete()
-    else:
-        answer.votes.update_or_create(user=request.user, defaults={"value": value})
 
-    return JsonResponse({"votes": answer.total_votes()})
+@login_required
+@ajax_required
+@require_http_methods(["GET"])
+def similar_questions(request):
+    """questions with a title like the one being typed into the question form, from the in-process index"""
+    title = request.GET.get('q', '').strip()[:255]
+    return JsonResponse({'questions': find_similar_questions(title) if title else []})
 
 
 @login_required
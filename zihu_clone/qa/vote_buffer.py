@@ -0,0 +1,359 @@
+"""optional write-behind buffer for question and answer votes
+
+with QA_VOTE_BUFFER set, a click is recorded in the buffer and the Vote table is written later in bulk by
+the flush_vote_buffer task, so a burst of voters on one question no longer contends on the same rows.
+"""
+import functools
+import json
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from zihu_clone.event_buffer import cache_lock, get_redis
+
+VOTE_BUFFER_FLUSH_DELAY = 5  # 秒，第一次投票后多久写回数据库
+
+
+def _counts(value):
+    """(up, down) a single vote of value contributes"""
+    if value is None:
+        return 0, 0
+    return (1, 0) if value else (0, 1)
+
+
+def pending_counts(entries):
+    up = down = 0
+    for stored, wanted in entries.values():
+        up += _counts(wanted)[0] - _counts(stored)[0]
+        down += _counts(wanted)[1] - _counts(stored)[1]
+    return up, down
+
+
+class BaseVoteBuffer(object):
+    """pending votes grouped by voted object, as {user_id: (stored, wanted)}
+
+    stored is the user's vote in the Vote table when the first pending click arrived, wanted the vote
+    after the latest click, both True, False or None. an object taken by drain stays in flight, its
+    entries are kept and keep counting until commit() runs after write_votes committed, so a click in
+    the meantime never reads a vote the flush has not written yet. subclasses provide the storage
+    primitives, each atomic on its own.
+    """
+
+    def lock(self, key, user_id):
+        """guards the entry of one user on one object, only clicks of the same user ever wait"""
+        raise NotImplementedError
+
+    def get_many(self, keys):
+        raise NotImplementedError
+
+    def get_entry(self, key, user_id):
+        raise NotImplementedError
+
+    def set_entry(self, key, user_id, entry):
+        raise NotImplementedError
+
+    def delete_entry(self, key, user_id):
+        raise NotImplementedError
+
+    def add_dirty(self, key):
+        raise NotImplementedError
+
+    def pop_dirty(self):
+        """remove and return the objects touched since the last call"""
+        raise NotImplementedError
+
+    def claim_inflight(self, key):
+        """True when no other flush is writing the object"""
+        raise NotImplementedError
+
+    def release_inflight(self, key):
+        raise NotImplementedError
+
+    def claim_flush(self):
+        """True for the caller that should schedule the next flush"""
+        raise NotImplementedError
+
+    def release_flush(self):
+        raise NotImplementedError
+
+    @staticmethod
+    def make_key(content_type_id, object_id):
+        return f'{content_type_id}:{object_id}'
+
+    def record(self, user_id, content_type_id, object_id, value, load_stored):
+        """apply one click, load_stored() reads the user's vote from the db when nothing is pending yet"""
+        key = self.make_key(content_type_id, object_id)
+        while True:
+            seen = self.get_entry(key, user_id)
+            loaded = load_stored() if seen is None else None  # the db is read before any lock is taken
+            with self.lock(key, user_id):
+                entry = self.get_entry(key, user_id)
+                if entry is None and seen is not None:
+                    continue  # committed and cleared meanwhile, the db holds the vote now
+                stored, current = entry if entry is not None else (loaded, loaded)
+                wanted = None if current == value else value
+                # kept even when wanted == stored, dropping it could expose the db to load_stored while
+                # a flush is still writing the earlier click, commit() clears settled entries
+                self.set_entry(key, user_id, (stored, wanted))
+            self.add_dirty(key)
+            return wanted
+
+    def pending(self, content_type_id, object_ids):
+        keys = {self.make_key(content_type_id, object_id): object_id for object_id in object_ids}
+        return {keys[key]: entries for key, entries in self.get_many(list(keys)).items() if entries}
+
+    def overlay(self, user, objects):
+        """add pending votes to score and user_vote of loaded questions or answers of one model"""
+        if not objects:
+            return
+        content_type = ContentType.objects.get_for_model(objects[0])
+        pending = self.pending(content_type.pk, [str(obj.pk) for obj in objects])
+        for obj in objects:
+            entries = pending.get(str(obj.pk))
+            if not entries:
+                continue
+            up, down = pending_counts(entries)
+            obj.upvote_count += up
+            obj.downvote_count += down
+            obj.score += up - down
+            if user.pk in entries:
+                obj.user_vote = entries[user.pk][1]
+
+    def drain(self):
+        """the pending votes of every object touched since the last drain, each marked in flight
+
+        every yielded object must be handed back to commit() once its votes are written, or to
+        restore() when writing them failed.
+        """
+        for key in self.pop_dirty():
+            if not self.claim_inflight(key):
+                self.add_dirty(key)  # an earlier flush still writes it, the next one picks it up
+                continue
+            entries = self.get_many([key]).get(key)
+            content_type_id, object_id = key.split(':', 1)
+            if entries:
+                yield int(content_type_id), object_id, entries
+            else:
+                self.release_inflight(key)
+
+    def commit(self, content_type_id, object_id, entries):
+        """clear the written entries, returns how many were clicked again meanwhile and stay pending"""
+        key = self.make_key(content_type_id, object_id)
+        left = 0
+        for user_id, written in entries.items():
+            with self.lock(key, user_id):
+                entry = self.get_entry(key, user_id)
+                if entry is None or tuple(entry) == tuple(written):
+                    self.delete_entry(key, user_id)
+                    continue
+                rebased = (written[1], entry[1])  # the db holds the written vote now
+                if rebased[0] == rebased[1]:
+                    self.delete_entry(key, user_id)
+                else:
+                    self.set_entry(key, user_id, rebased)
+                    left += 1
+        self.release_inflight(key)
+        if left:
+            self.add_dirty(key)
+        return left
+
+    def restore(self, content_type_id, object_id, entries):
+        """give back the entries of a failed flush, they never left the buffer"""
+        key = self.make_key(content_type_id, object_id)
+        self.release_inflight(key)
+        self.add_dirty(key)
+
+
+class CacheVoteBuffer(BaseVoteBuffer):
+    """buffer in the redis behind the default cache, shared by web and celery processes
+
+    each object's entries are a hash of user id to json [stored, wanted], the touched objects a set,
+    so concurrent clicks only meet in single HSET / SADD commands.
+    """
+    prefix = 'qa:vote-buffer:'
+    timeout = 60 * 60
+
+    def __init__(self):
+        if get_redis() is None:
+            raise ImproperlyConfigured('CacheVoteBuffer needs django-redis as the default cache')
+
+    @property
+    def redis(self):
+        return get_redis()
+
+    def lock(self, key, user_id):
+        return cache_lock(f'{self.prefix}lock:{key}:{user_id}')
+
+    def get_many(self, keys):
+        pipe = self.redis.pipeline()
+        for key in keys:
+            pipe.hgetall(self.prefix + key)
+        return {key: {int(user_id): tuple(json.loads(entry)) for user_id, entry in found.items()}
+                for key, found in zip(keys, pipe.execute()) if found}
+
+    def get_entry(self, key, user_id):
+        entry = self.redis.hget(self.prefix + key, user_id)
+        return tuple(json.loads(entry)) if entry is not None else None
+
+    def set_entry(self, key, user_id, entry):
+        pipe = self.redis.pipeline()
+        pipe.hset(self.prefix + key, user_id, json.dumps(list(entry)))
+        pipe.expire(self.prefix + key, self.timeout)
+        pipe.execute()
+
+    def delete_entry(self, key, user_id):
+        self.redis.hdel(self.prefix + key, user_id)
+
+    def add_dirty(self, key):
+        self.redis.sadd(f'{self.prefix}dirty', key)
+
+    def pop_dirty(self):
+        # SPOP removes what it returns, a key added after it lands in the next drain
+        count = self.redis.scard(f'{self.prefix}dirty')
+        if not count:
+            return []
+        return [key.decode() for key in self.redis.spop(f'{self.prefix}dirty', count)]
+
+    def claim_inflight(self, key):
+        return cache.add(f'{self.prefix}inflight:{key}', True, self.timeout)
+
+    def release_inflight(self, key):
+        cache.delete(f'{self.prefix}inflight:{key}')
+
+    def claim_flush(self):
+        return cache.add(f'{self.prefix}scheduled', True, self.timeout)
+
+    def release_flush(self):
+        cache.delete(f'{self.prefix}scheduled')
+
+
+class InMemoryVoteBuffer(BaseVoteBuffer):
+    """process local stand-in, lets the buffered mode be tested without redis"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.entries = {}
+        self.dirty = set()
+        self.inflight = set()
+        self.scheduled = False
+
+    @contextmanager
+    def lock(self, key, user_id):
+        with self._lock:
+            yield
+
+    def get_many(self, keys):
+        with self._lock:
+            return {key: dict(self.entries[key]) for key in keys if self.entries.get(key)}
+
+    def get_entry(self, key, user_id):
+        with self._lock:
+            return self.entries.get(key, {}).get(user_id)
+
+    def set_entry(self, key, user_id, entry):
+        with self._lock:
+            self.entries.setdefault(key, {})[user_id] = tuple(entry)
+
+    def delete_entry(self, key, user_id):
+        with self._lock:
+            entries = self.entries.get(key, {})
+            entries.pop(user_id, None)
+            if not entries:
+                self.entries.pop(key, None)
+
+    def add_dirty(self, key):
+        with self._lock:
+            self.dirty.add(key)
+
+    def pop_dirty(self):
+        with self._lock:
+            dirty, self.dirty = self.dirty, set()
+        return dirty
+
+    def claim_inflight(self, key):
+        with self._lock:
+            claimed = key not in self.inflight
+            self.inflight.add(key)
+        return claimed
+
+    def release_inflight(self, key):
+        with self._lock:
+            self.inflight.discard(key)
+
+    def claim_flush(self):
+        with self._lock:
+            claimed, self.scheduled = not self.scheduled, True
+        return claimed
+
+    def release_flush(self):
+        with self._lock:
+            self.scheduled = False
+
+
+@functools.lru_cache(maxsize=None)
+def get_vote_buffer():
+    """the configured buffer, None when votes are written synchronously"""
+    buffer_class = getattr(settings, 'QA_VOTE_BUFFER', None)
+    return import_string(buffer_class)() if buffer_class else None
+
+
+def buffered_toggle(buffer, user, model, object_id, value):
+    """Vote.objects.toggle in buffered mode: record the click, answer with db score plus pending votes"""
+    from zihu_clone.qa.models import Vote
+    from zihu_clone.qa.tasks import flush_vote_buffer
+
+    content_type = ContentType.objects.get_for_model(model)
+    score = model.objects.values_list('score', flat=True).get(pk=object_id)
+    buffer.record(
+        user.pk, content_type.pk, object_id, value,
+        lambda: Vote.objects.filter(user=user, content_type=content_type, object_id=object_id).values_list(
+            'value', flat=True).first()
+    )
+    if buffer.claim_flush():
+        transaction.on_commit(lambda: flush_vote_buffer.apply_async(countdown=VOTE_BUFFER_FLUSH_DELAY))
+    up, down = pending_counts(buffer.pending(content_type.pk, [object_id]).get(object_id, {}))
+    return score + up - down
+
+
+def write_votes(content_type_id, object_id, entries):
+    """write the pending votes of one object with bulk statements and shift its counters once"""
+    from zihu_clone.qa.models import Vote, apply_vote_counts
+    from zihu_clone.users.models import UserStats
+
+    model = ContentType.objects.get_for_id(content_type_id).model_class()
+    with transaction.atomic():
+        existing = {vote.user_id: vote for vote in Vote.objects.filter(
+            content_type_id=content_type_id, object_id=object_id, user_id__in=list(entries))}
+        created, flipped, deleted = [], {True: [], False: []}, []
+        up = down = 0
+        for user_id, (_, wanted) in entries.items():
+            vote = existing.get(user_id)
+            if wanted is None:
+                if vote is not None:
+                    deleted.append(vote.pk)  # counters follow through the Vote post_delete receiver
+            elif vote is None:
+                created.append(Vote(user_id=user_id, content_type_id=content_type_id,
+                                    object_id=object_id, value=wanted))
+                up, down = up + _counts(wanted)[0], down + _counts(wanted)[1]
+            elif vote.value != wanted:
+                flipped[wanted].append(vote.pk)
+                up, down = (up + 1, down - 1) if wanted else (up - 1, down + 1)
+
+        Vote.objects.bulk_create(created)
+        for vote in created:  # bulk_create sends no post_save for the profile counters
+            UserStats.objects.shift(vote.user_id, vote_count=1)
+        for value, pks in flipped.items():
+            if pks:
+                Vote.objects.filter(pk__in=pks).update(value=value, updated_at=timezone.now())
+        if deleted:
+            Vote.objects.filter(pk__in=deleted).delete()
+        if up or down:
+            apply_vote_counts(model, object_id, up, down)
+    return len(created) + len(flipped[True]) + len(flipped[False]) + len(deleted)
@@ -6,8 +6,55 @@ $(function () {
         $('.messages-list').scrollTop($('.messages-list')[0].scrollHeight);
     }
 
-    // AJAX POST发送消息
+    // 由 JSON 渲染一条消息，服务端不再返回 HTML
+    function renderMessage(data, pending) {
+        const mine = data.sender === currentUser;
+        const item = $('<div class="message"></div>')
+            .addClass(mine ? 'sent' : 'received')
+            .attr('message-id', data.id || '')
+            .attr('client-id', data.client_id || '');
+        $('<p class="message-text"></p>').text(data.message).appendTo(item);
+        $('<small class="message-time text-muted"></small>')
+            .text(data.created_at ? new Date(data.created_at).toLocaleString() : '')
+            .appendTo(item);
+        if (pending) {
+            item.addClass('pending');
+        }
+        return item;
+    }
+
+    // 已发送但尚未确认的消息，client_id -> 消息帧，重连后重发，服务端按 client_id 去重
+    const unacked = {};
+
+    function sendFrame(frame) {
+        if (ws.readyState === ws.OPEN) {
+            ws.send(JSON.stringify(frame));
+            return true;
+        }
+        return false;
+    }
+
     $("#send").submit(function () {
+        const input = $("input[name='message']");
+        const text = input.val();
+        if (!$.trim(text)) {
+            return false;
+        }
+        const frame = {
+            'type': 'send',
+            'to': $("input[name='to']").val(),
+            'message': text,
+            'client_id': currentUser + '-' + Date.now() + '-' + Math.random().toString(36).slice(2, 10)
+        };
+        if (sendFrame(frame)) {
+            unacked[frame.client_id] = frame;
+            $(".send-message").before(renderMessage({'sender': currentUser, 'message': text,
+                                                     'client_id': frame.client_id}, true));
+            input.val('');  // 消息发送框置为空
+            scrollConversationScreen();
+            return false;
+        }
+        // 没有可用的 WebSocket 时退回 AJAX POST
         $.ajax({
             url: '/messages/send-message/',
             data: $("#send").serialize(),
@@ -15,22 +62,67 @@ $(function () {
             type: 'POST',
             success: function (data) {
                 $(".send-message").before(data);  // 将接收到的消息插入到聊天框
-                $("input[name='message']").val(''); // 消息发送框置为空
+                input.val(''); // 消息发送框置为空
                 scrollConversationScreen();  // 滚动条下拉到底
             }
         });
         return false;
     });
 
+    // 滚动到顶部时加载更早的消息，游标由 data-next 给出
+    var loadingOlder = false;
+    $('.messages-list').scroll(function () {
+        var list = $(this);
+        var cursor = list.data('next');
+        if (list.scrollTop() > 0 || !cursor || loadingOlder) {
+            return;
+        }
+        loadingOlder = true;
+        $.ajax({
+            url: window.location.pathname,
+            data: {'page': cursor},
+            cache: false,
+            type: 'GET',
+            success: function (data) {
+                var height = list[0].scrollHeight;
+                list.prepend(data.messages);
+                list.data('next', data.next || '');
+                list.scrollTop(list[0].scrollHeight - height);  // 保持当前可见的消息不动
+            },
+            complete: function () {
+                loadingOlder = false;
+            }
+        });
+    });
+
     // WebSocket连接，使用wss(https)或者ws(http)
     const ws_scheme = window.location.protocol === "https:" ? "wss" : "ws";
     const ws_path = ws_scheme + "://" + window.location.host + "/ws/" + currentUser + "/";
     const ws = new ReconnectingWebSocket(ws_path);
+    ws.onopen = function () {
+        $.each(unacked, function (client_id, frame) {
+            sendFrame(frame);
+        });
+    };
+    setInterval(function () {
+        sendFrame({'type': 'heartbeat'});  // 维持在线状态
+    }, 25000);
     // 监听后端发送过来的消息
     ws.onmessage = function (event) {
         const data = JSON.parse(event.data);
-        if (data.sender === activeUser) {  // 发送者为当前选中的用户
-            $(".send-message").before(data.message); // 将接收到的消息插入到聊天框
+        if (data.type === 'ack') {
+            delete unacked[data.client_id];
+            $('[client-id="' + data.client_id + '"]').removeClass('pending').attr('message-id', data.id);
+        } else if (data.type === 'error' && data.retry && unacked[data.client_id]) {
+            var frame = unacked[data.client_id];
+            setTimeout(function () {
+                sendFrame(frame);  // 上一次发送仍在保存，稍后重发同一个 client_id
+            }, 1000);
+        } else if (data.type === 'error') {
+            delete unacked[data.client_id];
+            $('[client-id="' + data.client_id + '"]').removeClass('pending').addClass('failed');
+        } else if (data.type === 'message' && data.sender === activeUser) {  // 发送者为当前选中的用户
+            $(".send-message").before(renderMessage(data)); // 将接收到的消息插入到聊天框
             scrollConversationScreen();  // 滚动条下拉到底
         }
     }
@@ -130,6 +130,33 @@ $(function () {
                 $("input[name=parent]").val(data.uuid);
                 $("#newsContent").html(data.news);
                 $("#threadContent").html(data.thread);
+                showOlderReplies(data.uuid, data.next);
+            }
+        });
+        return false;
+    });
+
+    function showOlderReplies(news, cursor) {
+        // 评论按页加载，next 为空时已到最早的评论
+        $("#loadOlderReplies").remove();
+        if (!cursor) {
+            return;
+        }
+        $("<li id='loadOlderReplies' class='text-center'><a href='#'>加载更早的评论</a></li>")
+            .data({'news': news, 'cursor': cursor})
+            .appendTo("#threadContent");
+    }
+
+    $("#threadContent").on("click", "#loadOlderReplies a", function () {
+        var more = $("#loadOlderReplies");
+        $.ajax({
+            url: '/news/get-thread/',
+            data: {'news': more.data('news'), 'cursor': more.data('cursor')},
+            cache: false,
+            success: function (data) {
+                more.remove();
+                $("#threadContent").append(data.thread);
+                showOlderReplies(data.uuid, data.next);
             }
         });
         return false;
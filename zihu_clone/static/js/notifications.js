@@ -1,35 +1,66 @@
 $(function () {
-    const emptyMessage = '没有未读通知';
     const notice = $('#notifications');
+    let latestSlugs = [];  // 弹出框中显示的最新未读通知
 
     function CheckNotifications() {
         $.ajax({
-            url: '/notifications/latest-notifications/',
+            url: '/notifications/unread/',  // 未读数由服务端缓存维护
             cache: false,
             success: function (data) {
-                if (!data.includes(emptyMessage)) {
-                    notice.addClass('btn-danger');
-                }
+                notice.toggleClass('btn-danger', data.unread > 0);
+                latestSlugs = data.notifications.map(notification => notification.slug);
             },
         });
     }
 
+    // 弹出框中的通知已被看到，一次请求批量标为已读
+    function markShownAsRead() {
+        if (latestSlugs.length === 0) {
+            return;
+        }
+        const csrftoken = (document.cookie.match(/(?:^|;\s*)csrftoken=([^;]*)/) || [])[1];
+        $.ajax({
+            url: '/notifications/mark-as-read/',
+            data: {'slugs': latestSlugs},
+            type: 'POST',
+            cache: false,
+            headers: {'X-CSRFToken': csrftoken ? decodeURIComponent(csrftoken) : ''},
+        });
+        latestSlugs = [];
+    }
+
     CheckNotifications();  // 页面加载时执行
 
-    function update_social_activity(id_value) {
-        const newsToUpdate = $('[news-id=' + id_value + ']');
+    // 短时间内的多个更新合并为一次批量请求
+    let pendingUpdates = [];
+
+    function flush_social_activity() {
+        const ids = pendingUpdates;
+        pendingUpdates = [];
         $.ajax({
-            url: '/news/update-interactions/',
-            data: {'id_value': id_value},
+            url: '/news/update-interactions/batch/',
+            data: {'ids': ids},
             type: 'POST',
             cache: false,
             success: function (data) {
-                $(".like-count", newsToUpdate).text(data.likes);
-                $(".comment-count", newsToUpdate).text(data.comments);
+                $.each(data.interactions, function (id_value, counts) {
+                    const newsToUpdate = $('[news-id=' + id_value + ']');
+                    $(".like-count", newsToUpdate).text(counts.likes);
+                    $(".comment-count", newsToUpdate).text(counts.comments);
+                });
             },
         });
     }
 
+    function update_social_activity(id_value) {
+        if (pendingUpdates.length === 0) {
+            setTimeout(flush_social_activity, 1000);
+        }
+        if (!pendingUpdates.includes(id_value)) {
+            pendingUpdates.push(id_value);
+        }
+    }
+
     notice.click(function () {
         if ($('.popover').is(':visible')) {
             notice.popover('hide');
@@ -48,7 +79,8 @@ $(function () {
                         content: data,
                     });
                     notice.popover('show');
-                    notice.removeClass('btn-danger')
+                    notice.removeClass('btn-danger');
+                    markShownAsRead();
                 },
             });
         }
@@ -60,6 +92,20 @@ $(function () {
     const ws_path = ws_scheme + '://' + window.location.host + '/ws/notifications/';
     const ws = new ReconnectingWebSocket(ws_path);
 
+    // 服务端只推送本人的通知，动态页面另外订阅 news 主题（新动态提示、点赞评论数）
+    ws.onopen = function () {
+        if ($('.stream-update').length || $('[news-id]').length) {
+            ws.send(JSON.stringify({'type': 'subscribe', 'topic': 'news'}));
+        }
+    };
+
+    // 心跳，服务端据此维护在线状态（60 秒未收到即视为离线）
+    setInterval(function () {
+        if (ws.readyState === ws.OPEN) {
+            ws.send(JSON.stringify({'type': 'heartbeat'}));
+        }
+    }, 25000);
+
     // 监听后端发送过来的消息
     ws.onmessage = function (event) {
         const data = JSON.parse(event.data);
@@ -71,14 +117,11 @@ $(function () {
                 break;
 
             case "social_update":
-                if (currentUser !== data.actor_name) {
-                    notice.addClass('btn-danger');
-                }
                 update_social_activity(data.id_value);
                 break;
 
             case "additional_news":
-                if (currentUser !== data.actor_name) {
+                if (data.actors.some(actor => actor !== currentUser)) {
                     $('.stream-update').show();
                 }
                 break;
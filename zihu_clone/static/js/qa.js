@@ -125,4 +125,35 @@ $(function () {
             }
         });
     });
+    var similarTimer = null;
+    $("#question-form input[name='title']").on("input", function () {
+        // Suggest existing questions with a similar title while the question is typed.
+        var input = $(this);
+        var list = $("#similar-questions");
+        if (!list.length) {
+            list = $('<ul id="similar-questions" class="list-unstyled small"></ul>').insertAfter(input);
+        }
+        clearTimeout(similarTimer);
+        similarTimer = setTimeout(function () {
+            var title = $.trim(input.val());
+            if (title.length < 3) {
+                list.empty();
+                return;
+            }
+            $.ajax({
+                url: '/qa/similar-questions/',
+                data: {'q': title},
+                type: 'get',
+                cache: false,
+                success: function (data) {
+                    list.empty();
+                    $.each(data.questions, function (i, question) {
+                        $('<li></li>').append(
+                            $('<a target="_blank"></a>').attr("href", "/qa/question-detail/" + question.pk + "/").text(question.title)
+                        ).appendTo(list);
+                    });
+                }
+            });
+        }, 250);
+    });
 });
@@ -0,0 +1,39 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import Count
+
+from taggit.models import TaggedItem
+
+POPULAR_TAGS_LIMIT = 20
+POPULAR_TAGS_CACHED = 100  # 缓存中最多保留的标签数
+POPULAR_TAGS_TIMEOUT = 60 * 60
+
+
+def _cache_key(model):
+    return f'tags:counted:{model._meta.label_lower}'
+
+
+def count_tags(queryset, limit=POPULAR_TAGS_LIMIT):
+    """count tags of the rows in queryset with one grouped query over TaggedItem, most used first"""
+    content_type = ContentType.objects.get_for_model(queryset.model)
+    counted = TaggedItem.objects.filter(
+        content_type=content_type,
+        object_id__in=queryset.order_by().values('pk')
+    ).values('tag__name').annotate(count=Count('pk')).order_by('-count', 'tag__name')
+    if limit:
+        counted = counted[:limit]
+    return [(row['tag__name'], row['count']) for row in counted]
+
+
+def get_counted_tags(queryset, limit=POPULAR_TAGS_LIMIT):
+    """cached version of count_tags, one entry per model, dropped whenever tags change"""
+    key = _cache_key(queryset.model)
+    counted = cache.get(key)
+    if counted is None:
+        counted = count_tags(queryset, limit=POPULAR_TAGS_CACHED)
+        cache.set(key, counted, POPULAR_TAGS_TIMEOUT)
+    return counted[:limit]
+
+
+def invalidate_counted_tags(model):
+    cache.delete(_cache_key(model))
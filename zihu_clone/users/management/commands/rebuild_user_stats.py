@@ -0,0 +1,21 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from zihu_clone.users.models import UserStats
+
+
+class Command(BaseCommand):
+    help = 'recompute the profile counters of every user (or of the given usernames) from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('pk')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        rebuilt = 0
+        for user in users.iterator():
+            UserStats.objects.rebuild(user)
+            rebuilt += 1
+        self.stdout.write(f'rebuilt stats of {rebuilt} users')
@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractUser
+from django.conf import settings
 from django.db import models
+from django.db.models import F
 from django.urls import reverse
 class User(AbstractUser):
     nickname = models.CharField(null=True, blank=True, max_length=255, verbose_name='nickname')
@@ -32,3 +34,75 @@ class User(AbstractUser):
 
     def get_absolute_url(self):
         return reverse("users:detail", kwargs={"username": self.username})
+
+
+class UserStatsQuerySet(models.query.QuerySet):
+
+    def for_user(self, user):
+        """the stats row of user (free when loaded with select_related('stats')), computed on first use"""
+        try:
+            return user.stats
+        except UserStats.DoesNotExist:
+            return self.rebuild(user)
+
+    def rebuild(self, user):
+        return self.update_or_create(user=user, defaults=UserStats.compute(user))[0]
+
+    def shift(self, user_id, **deltas):
+        """add deltas to the counters of user_id in SQL, a user without stats yet gets them on first read"""
+        if user_id is not None:
+            self.filter(user_id=user_id).update(**{field: F(field) + delta for field, delta in deltas.items()})
+
+
+class UserStats(models.Model):
+    """profile counters, kept current by zihu_clone.users.signals, rebuilt by the rebuild_user_stats command"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, primary_key=True, related_name='stats',
+                                on_delete=models.CASCADE, verbose_name='user')
+    news_count = models.IntegerField(default=0, verbose_name='news posted')
+    news_reply_count = models.IntegerField(default=0, verbose_name='news replies')
+    article_count = models.IntegerField(default=0, verbose_name='published articles')
+    comment_count = models.IntegerField(default=0, verbose_name='article comments')
+    question_count = models.IntegerField(default=0, verbose_name='questions')
+    answer_count = models.IntegerField(default=0, verbose_name='answers')
+    like_count = models.IntegerField(default=0, verbose_name='news liked')
+    vote_count = models.IntegerField(default=0, verbose_name='question and answer votes')
+    conversation_count = models.IntegerField(default=0, verbose_name='conversation partners')
+
+    objects = UserStatsQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'user statistics'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f'{self.user_id} stats'
+
+    @staticmethod
+    def compute(user):
+        """every counter counted from scratch"""
+        import django_comments
+        from zihu_clone.articles.models import Article
+        from zihu_clone.messager.models import Conversation
+        from zihu_clone.news.models import News
+        from zihu_clone.qa.models import Answer, Question, Vote
+
+        return {
+            'news_count': News.objects.filter(user=user, reply=False).count(),
+            'news_reply_count': News.objects.filter(user=user, reply=True).count(),
+            'article_count': Article.objects.filter(user=user, status='P').count(),
+            'comment_count': django_comments.get_model().objects.filter(user=user).count(),
+            'question_count': Question.objects.filter(user=user).count(),
+            'answer_count': Answer.objects.filter(user=user).count(),
+            'like_count': News.liked.through.objects.filter(user=user).count(),
+            'vote_count': Vote.objects.filter(user=user).count(),
+            'conversation_count': Conversation.objects.filter(
+                models.Q(user_one=user) | models.Q(user_two=user)).count(),
+        }
+
+    @property
+    def comments(self):
+        return self.news_reply_count + self.comment_count
+
+    @property
+    def interactions(self):
+        return self.like_count + self.vote_count + self.comments + self.conversation_count
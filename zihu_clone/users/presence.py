@@ -0,0 +1,121 @@
+"""who is online, fed by the websocket consumers
+
+every open socket is an entry (user, channel name) that expires PRESENCE_TTL seconds after its last
+connect or heartbeat, so sockets that die without a disconnect drop out by themselves. a user is
+online while any of their entries is alive.
+"""
+import functools
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.module_loading import import_string
+
+from zihu_clone.event_buffer import get_redis
+
+PRESENCE_TTL = 60  # 秒，客户端每 25 秒发送一次心跳
+ONLINE_USERS_LIMIT = 50
+
+
+class BasePresenceStore(object):
+    """socket entries of online users, subclasses provide touch, leave and the expiring read"""
+
+    def touch(self, user_id, channel_name):
+        """connect or heartbeat"""
+        raise NotImplementedError
+
+    def leave(self, user_id, channel_name):
+        raise NotImplementedError
+
+    def expiries(self):
+        """{user_id: latest expiry} of the users with a live socket"""
+        raise NotImplementedError
+
+    def online_user_ids(self):
+        """ids of the online users, most recently seen first"""
+        expiries = self.expiries()
+        return sorted(expiries, key=expiries.get, reverse=True)
+
+    def is_online(self, user_id):
+        return user_id in self.expiries()
+
+
+class InMemoryPresenceStore(BasePresenceStore):
+    """process local store, enough for a single daphne process and for tests"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sockets = {}  # (user_id, channel_name) -> expires_at
+
+    def touch(self, user_id, channel_name):
+        with self.lock:
+            self.sockets[(user_id, channel_name)] = time.time() + PRESENCE_TTL
+
+    def leave(self, user_id, channel_name):
+        with self.lock:
+            self.sockets.pop((user_id, channel_name), None)
+
+    def expiries(self):
+        now = time.time()
+        expiries = {}
+        with self.lock:
+            for (user_id, channel_name), expires in list(self.sockets.items()):
+                if expires <= now:
+                    del self.sockets[(user_id, channel_name)]
+                else:
+                    expiries[user_id] = max(expires, expiries.get(user_id, 0))
+        return expiries
+
+
+class CachePresenceStore(BasePresenceStore):
+    """a redis sorted set of "user_id:channel_name" members scored by expiry, shared by every daphne process
+
+    each connect, heartbeat and disconnect is a single ZADD or ZREM, no lock and no rewrite of the
+    set, reads drop the expired members and walk only the live ones. without redis behind the cache
+    it falls back to an InMemoryPresenceStore.
+    """
+    key = 'presence:sockets'
+
+    def __init__(self):
+        self.fallback = InMemoryPresenceStore()
+
+    def touch(self, user_id, channel_name):
+        redis = get_redis()
+        if redis is None:
+            return self.fallback.touch(user_id, channel_name)
+        redis.zadd(self.key, {f'{user_id}:{channel_name}': time.time() + PRESENCE_TTL})
+
+    def leave(self, user_id, channel_name):
+        redis = get_redis()
+        if redis is None:
+            return self.fallback.leave(user_id, channel_name)
+        redis.zrem(self.key, f'{user_id}:{channel_name}')
+
+    def expiries(self):
+        redis = get_redis()
+        if redis is None:
+            return self.fallback.expiries()
+        now = time.time()
+        pipe = redis.pipeline()
+        pipe.zremrangebyscore(self.key, '-inf', now)
+        pipe.zrangebyscore(self.key, now, '+inf', withscores=True)
+        _, members = pipe.execute()
+        expiries = {}
+        for member, expires in members:
+            user_id = int(member.decode().split(':', 1)[0])
+            expiries[user_id] = max(expires, expiries.get(user_id, 0))
+        return expiries
+
+
+@functools.lru_cache(maxsize=None)
+def get_presence_store():
+    store_class = getattr(settings, 'USER_PRESENCE_STORE', 'zihu_clone.users.presence.CachePresenceStore')
+    return import_string(store_class)()
+
+
+def get_online_users(exclude=None, limit=ONLINE_USERS_LIMIT):
+    """online users, most recently seen first, one pk lookup over the ids in the presence store"""
+    user_ids = [user_id for user_id in get_presence_store().online_user_ids() if user_id != exclude][:limit]
+    users = get_user_model().objects.filter(is_active=True).in_bulk(user_ids)
+    return [users[user_id] for user_id in user_ids if user_id in users]
@@ -0,0 +1,95 @@
+"""keep UserStats in step with the write paths of the other apps"""
+import django_comments
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from zihu_clone.articles.models import Article
+from zihu_clone.messager.models import Conversation
+from zihu_clone.news.models import News
+from zihu_clone.qa.models import Answer, Question, Vote
+from zihu_clone.users.models import UserStats
+
+Comment = django_comments.get_model()
+NewsLike = News.liked.through
+
+
+def _sign(created=None):
+    """+1 for a post_save that created the row, -1 for a post_delete, None for a plain update"""
+    if created is None:
+        return -1
+    return 1 if created else None
+
+
+@receiver(post_save, sender=get_user_model())
+def user_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=News)
+@receiver(post_delete, sender=News)
+def news_changed(sender, instance, created=None, **kwargs):
+    sign = _sign(created)
+    if sign:
+        field = 'news_reply_count' if instance.reply else 'news_count'
+        UserStats.objects.shift(instance.user_id, **{field: sign})
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_delete, sender=Article)
+def article_changed(sender, instance, **kwargs):
+    """drafts do not count and publishing is an update, so recount the author's published articles"""
+    if instance.user_id is not None:
+        UserStats.objects.filter(user_id=instance.user_id).update(
+            article_count=Article.objects.filter(user_id=instance.user_id, status='P').count())
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, created=None, **kwargs):
+    sign = _sign(created)
+    if sign:
+        UserStats.objects.shift(instance.user_id, comment_count=sign)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_changed(sender, instance, created=None, **kwargs):
+    sign = _sign(created)
+    if sign:
+        UserStats.objects.shift(instance.user_id, question_count=sign)
+
+
+@receiver(post_save, sender=Answer)
+@receiver(post_delete, sender=Answer)
+def answer_changed(sender, instance, created=None, **kwargs):
+    sign = _sign(created)
+    if sign:
+        UserStats.objects.shift(instance.user_id, answer_count=sign)
+
+
+@receiver(post_save, sender=NewsLike)
+@receiver(post_delete, sender=NewsLike)
+def like_changed(sender, instance, created=None, **kwargs):
+    sign = _sign(created)
+    if sign:
+        UserStats.objects.shift(instance.user_id, like_count=sign)
+
+
+@receiver(post_save, sender=Vote)
+@receiver(post_delete, sender=Vote)
+def vote_changed(sender, instance, created=None, **kwargs):
+    """the vote buffer writes with bulk_create, which sends no post_save, and shifts vote_count itself"""
+    sign = _sign(created)
+    if sign:
+        UserStats.objects.shift(instance.user_id, vote_count=sign)
+
+
+@receiver(post_save, sender=Conversation)
+@receiver(post_delete, sender=Conversation)
+def conversation_changed(sender, instance, created=None, **kwargs):
+    sign = _sign(created)
+    if sign:
+        for user_id in {instance.user_one_id, instance.user_two_id}:
+            UserStats.objects.shift(user_id, conversation_count=sign)
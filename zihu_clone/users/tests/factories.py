@@ -0,0 +1,13 @@
+from django.contrib.auth import get_user_model
+
+from factory import DjangoModelFactory, Faker, PostGenerationMethodCall, Sequence
+
+
+class UserFactory(DjangoModelFactory):
+    username = Sequence(lambda n: f'user{n}')
+    email = Faker('email')
+    password = PostGenerationMethodCall('set_password', 'password')
+
+    class Meta:
+        model = get_user_model()
+        django_get_or_create = ['username']
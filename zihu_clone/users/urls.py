@@ -3,5 +3,6 @@ from zihu_clone.users import views
 app_name = "users"
 urlpatterns = [
     path("update/", views.UserUpdateView.as_view(), name="update"),
+    path("online/", views.online_users, name="online"),
     path("<str:username>/", views.UserDetailView.as_view(), name="detail")
 ]
@@ -1,36 +1,33 @@
 from django.contrib.auth import get_user_model
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import JsonResponse
 from django.urls import reverse
 from django.views.generic import DetailView, RedirectView, UpdateView
 
+from zihu_clone.users.models import UserStats
+from zihu_clone.users.presence import get_online_users
+
 User = get_user_model()
 
 
 class UserDetailView(LoginRequiredMixin, DetailView):
 
-    model = User
+    queryset = User.objects.select_related('stats')
     template_name = 'users/user_detail.html'
     slug_field = "username"
     slug_url_kwarg = "username"
 
     def get_context_data(self, *args, **kwargs):
+        """counters of the viewed profile, its UserStats row comes with the user in one query"""
         context = super(UserDetailView, self).get_context_data(**kwargs)
-        user = User.objects.get(username=self.request.user.username)
-        context["moments_num"] = user.publisher.filter(reply=False).count()
-        context["article_num"] = user.author.filter(status='P').count()
-        context["comment_num"] = user.publisher.filter(reply=True).count() + user.comment_comments.all().count()
-        context["question_num"] = user.q_author.all().count()
-        context["answer_num"] = user.a_author.all().count()
-
-        tmp = set()
-        sent_num = user.sent_messages.all()
-        for i in sent_num:
-            tmp.add(i.recipient.username)
-        received_num = user.received_messages.all()
-        for r in received_num:
-            tmp.add(r.sender.username)
-
-        context["interaction_num"] = user.liked_news.all().count() + user.qa_vote.all().count() + context["comment_num"] + len(tmp)
+        stats = UserStats.objects.for_user(self.object)
+        context["moments_num"] = stats.news_count
+        context["article_num"] = stats.article_count
+        context["comment_num"] = stats.comments
+        context["question_num"] = stats.question_count
+        context["answer_num"] = stats.answer_count
+        context["interaction_num"] = stats.interactions
         return context
 
 class UserUpdateView(LoginRequiredMixin, UpdateView):
@@ -46,3 +43,13 @@ class UserUpdateView(LoginRequiredMixin, UpdateView):
 
     def get_object(self, queryset=None):
         return self.request.user
+
+
+@login_required
+def online_users(request):
+    return JsonResponse({'users': [{
+        'username': user.username,
+        'name': user.get_profile_name(),
+        'picture': user.picture.url if user.picture else None,
+        'url': user.get_absolute_url(),
+    } for user in get_online_users(exclude=request.user.pk)]})